@@ -16,6 +16,7 @@ import sys
 import os
 import time
 import json
+from urllib.parse import parse_qsl
 
 # Add parent directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -178,7 +179,7 @@ def demo_complete_oidc_flow():
     )
     
     print("  Token request parameters:")
-    req_data = token_request_info['token_request']
+    req_data = dict(parse_qsl(token_request_info['token_body'].decode('ascii')))
     for key, value in req_data.items():
         if key != 'client_secret':
             val_str = str(value)[:50]
@@ -145,7 +145,7 @@ def demo_kemtls_protocol():
     
     # Server creates SERVER_HELLO
     print("\n2️⃣  SERVER → CLIENT: SERVER_HELLO")
-    server_hello, ciphertext, shared_secret = server.create_server_hello(client_kem_pk)
+    server_hello, ciphertext, shared_secret, _ = server.create_server_hello(client_kem_pk)
     print(f"   ✓ Server encapsulates shared secret: {shared_secret[:16].hex()}...")
     print(f"   ✓ Server sends ciphertext: {len(ciphertext)} bytes")
     print(f"   ✓ Server sends certificate: {len(server.certificate.to_bytes())} bytes")
@@ -243,7 +243,8 @@ class BenchmarkSuite:
         issuer = "http://localhost:5000"
         
         for alg in algorithms:
-            handler = PQJWTHandler(algorithm=alg, issuer=issuer)
+            # Verification cache off: every iteration must run the PQ verify
+            handler = PQJWTHandler(algorithm=alg, issuer=issuer, verify_cache_size=0)
             handler.generate_keypair()
             
             # JWT Creation
@@ -9,19 +9,191 @@ Combines all markdown documentation into a comprehensive PDF:
 - API documentation
 - Security analysis
 - References to benchmark results
+
+Usage:
+    python src/docs/generate_technical_doc.py [--draft] [--unicode] [-o OUTPUT]
+
+    --draft   Fast preview build: renders with xelatex and disables PDF
+              stream compression (xdvipdfmx -z0). Use the default
+              (compressed) build for releases.
+    --unicode Keep box-drawing, arrow and check-mark glyphs and emoji; by
+              default glyphs are rewritten as ASCII and emoji dropped
+              (accented letters are kept either way).
 """
 
+import argparse
+import ast
+import gzip
+import hashlib
+import importlib
 import os
+import re
+import shutil
 import subprocess
+import unicodedata
 from datetime import datetime
+from pathlib import Path
+from string import Template
+
+# HTML wrapper for the markdown2 + pdfkit fallback; only ${body} varies.
+_HTML_TEMPLATE = Template("""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Technical Documentation</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 40px; }
+        h1 { color: #2c3e50; border-bottom: 2px solid #3498db; padding-bottom: 10px; }
+        h2 { color: #34495e; margin-top: 30px; }
+        code { background: #f4f4f4; padding: 2px 5px; border-radius: 3px; }
+        pre { background: #f4f4f4; padding: 15px; border-radius: 5px; overflow-x: auto; }
+        table { border-collapse: collapse; width: 100%; margin: 20px 0; }
+        th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+        th { background-color: #3498db; color: white; }
+    </style>
+</head>
+<body>
+${body}
+</body>
+</html>
+""")
+
+# Box-drawing, arrow and check-mark glyphs used in the diagrams and the
+# README, mapped to ASCII so the LaTeX engines do not need Unicode font
+# substitution.
+_ASCII_TABLE = str.maketrans({
+    "─": "-", "│": "|",
+    "┌": "+", "┐": "+", "└": "+", "┘": "+", "├": "+", "┤": "+",
+    "↓": "v", "→": "->", "←": "<-", "►": ">", "◄": "<",
+    "✅": "[x]", "✓": "[x]",
+})
+
+# Remaining non-ASCII characters; symbols among them (the README's emoji)
+# have no pdflatex rendering and are dropped.
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+def _drop_symbol(match: re.Match) -> str:
+    """Return a matched character unless it is an emoji/pictograph."""
+    ch = match.group()
+    return "" if ch == "\ufe0f" or unicodedata.category(ch) == "So" else ch
+
+def _box_drawing_to_ascii(text: str) -> str:
+    """Replace diagram glyphs with ASCII equivalents and drop emoji."""
+    return _NON_ASCII.sub(_drop_symbol, text.translate(_ASCII_TABLE))
+
+# Gzip-compressed PDFs keyed by the hash of the rendered markdown + options,
+# so unchanged documentation is not rebuilt.
+_PDF_CACHE_DIR = os.path.join("benchmark_results", "pdf_cache")
+
+def _cache_path(content: str, draft: bool) -> str:
+    """Return the cache location for a given document and build mode."""
+    key = hashlib.sha256(content.encode("utf-8"))
+    key.update(b"draft" if draft else b"release")
+    return os.path.join(_PDF_CACHE_DIR, f"{key.hexdigest()}.pdf.gz")
+
+def _restore_cached_pdf(cache_path: str, output_file: str) -> bool:
+    """Decompress a cached PDF to ``output_file`` if one exists."""
+    if not os.path.exists(cache_path):
+        return False
+    tmp_path = output_file + ".part"
+    with gzip.open(cache_path, "rb") as src, open(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, output_file)
+    return True
+
+def _store_cached_pdf(output_file: str, cache_path: str) -> None:
+    """Save a freshly generated PDF into the cache."""
+    os.makedirs(_PDF_CACHE_DIR, exist_ok=True)
+    tmp_path = cache_path + ".part"
+    with open(output_file, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, cache_path)
+
+# Source tree and the modules whose public API is rendered into the
+# "API Reference" section straight from their signatures and docstrings.
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_API_MODULES = [
+    ("KEM Module", "pq_crypto/kem.py"),
+    ("Signature Module", "pq_crypto/signature.py"),
+    ("Crypto Utilities", "pq_crypto/utils.py"),
+    ("KEMTLS Protocol", "kemtls/protocol.py"),
+    ("JWT Module", "oidc/pq_jwt.py"),
+    ("OIDC Server", "oidc/server.py"),
+    ("OIDC Client", "oidc/client.py"),
+]
+
+def _is_public(name: str) -> bool:
+    return not name.startswith("_") and not name.startswith("test_")
+
+def _render_function(node, indent: str = "") -> list:
+    """Render a function stub: its signature followed by its docstring."""
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    lines = [f"{indent}@{ast.unparse(d)}" for d in node.decorator_list]
+    lines.append(f"{indent}def {node.name}({ast.unparse(node.args)}){returns}:")
+    doc = ast.get_docstring(node)
+    if doc:
+        body = [f"{indent}    {line}".rstrip() for line in doc.splitlines()]
+        lines += [f'{indent}    \"\"\"'] + body + [f'{indent}    \"\"\"']
+    return lines
+
+def _render_module_api(path: str) -> str:
+    """Render public classes and functions of a source file as Python stubs."""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    
+    lines = []
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and _is_public(node.name):
+            lines.append(f"class {node.name}:")
+            for item in node.body:
+                if isinstance(item, ast.FunctionDef) and (
+                        _is_public(item.name) or item.name == "__init__"):
+                    lines += _render_function(item, indent="    ")
+                    lines.append("")
+        elif isinstance(node, ast.FunctionDef) and _is_public(node.name):
+            lines += _render_function(node)
+            lines.append("")
+    return "\n".join(lines).rstrip()
+
+def _render_api_reference() -> str:
+    """Build the API Reference section from the real modules.
+    
+    The rendered block is cached on disk, keyed by the source files' mtimes,
+    so it is only re-parsed when one of the modules changes.
+    """
+    paths = [os.path.join(_SRC_DIR, rel) for _, rel in _API_MODULES]
+    key = hashlib.sha256(
+        "".join(f"{p}:{os.stat(p).st_mtime_ns};" for p in paths).encode("utf-8")
+    ).hexdigest()
+    cache_file = os.path.join(_PDF_CACHE_DIR, f"api_reference_{key}.md")
+    if os.path.exists(cache_file):
+        return Path(cache_file).read_text(encoding="utf-8")
+    
+    sections = ["## API Reference\n"]
+    for (title, rel), path in zip(_API_MODULES, paths):
+        sections.append(f"### {title} (`{rel}`)\n\n```python\n{_render_module_api(path)}\n```\n")
+    reference = "\n".join(sections) + "\n"
+    
+    os.makedirs(_PDF_CACHE_DIR, exist_ok=True)
+    Path(cache_file).write_text(reference, encoding="utf-8")
+    return reference
+
+def _import_optional(name):
+    """Import an optional fallback dependency only when it is needed."""
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        raise ImportError(f"{name} is required for the HTML fallback (pip install {name})") from e
 
 def create_combined_markdown():
     """Combine all markdown files into one comprehensive document."""
     
+    today = datetime.now().strftime("%B %d, %Y")
+    
     content = f"""---
 title: Post-Quantum OIDC with KEMTLS - Technical Documentation
 author: PQ-OIDC Project
-date: {datetime.now().strftime("%B %d, %Y")}
+date: {today}
 geometry: margin=1in
 documentclass: report
 fontsize: 11pt
@@ -329,115 +501,11 @@ PQC/
 └── README.md              # Project documentation
 ```
 
-## API Reference
-
-### KEM Module (`pq_crypto/kem.py`)
-
-```python
-class KyberKEM:
-    def __init__(self, algorithm: str = "Kyber512"):
-        \"\"\"Initialize Kyber KEM.
-        
-        Args:
-            algorithm: One of "Kyber512", "Kyber768", "Kyber1024"
-        \"\"\"
-        
-    def generate_keypair(self) -> tuple[bytes, bytes]:
-        \"\"\"Generate new keypair.
-        
-        Returns:
-            (public_key, secret_key) tuple
-        \"\"\"
-        
-    def encapsulate(self, public_key: bytes) -> tuple[bytes, bytes]:
-        \"\"\"Encapsulate shared secret.
-        
-        Args:
-            public_key: Recipient's public key
-            
-        Returns:
-            (ciphertext, shared_secret) tuple
-        \"\"\"
-        
-    def decapsulate(self, ciphertext: bytes, secret_key: bytes) -> bytes:
-        \"\"\"Decapsulate shared secret.
-        
-        Args:
-            ciphertext: Ciphertext from encapsulation
-            secret_key: Recipient's secret key
-            
-        Returns:
-            Shared secret (matches encapsulation output)
-        \"\"\"
-```
-
-### Signature Module (`pq_crypto/signature.py`)
-
-```python
-class DilithiumSigner:
-    def __init__(self, algorithm: str = "ML-DSA-44"):
-        \"\"\"Initialize Dilithium/ML-DSA signer.
-        
-        Args:
-            algorithm: One of "ML-DSA-44", "ML-DSA-65", "ML-DSA-87"
-        \"\"\"
-        
-    def generate_keypair(self) -> tuple[bytes, bytes]:
-        \"\"\"Generate signing keypair.\"\"\"
-        
-    def sign(self, message: bytes, secret_key: bytes) -> bytes:
-        \"\"\"Sign message.
-        
-        Args:
-            message: Data to sign
-            secret_key: Signer's secret key
-            
-        Returns:
-            Digital signature
-        \"\"\"
-        
-    def verify(self, message: bytes, signature: bytes, 
-               public_key: bytes) -> bool:
-        \"\"\"Verify signature.
-        
-        Returns:
-            True if signature is valid, False otherwise
-        \"\"\"
-```
-
-### JWT Module (`oidc/pq_jwt.py`)
-
-```python
-def create_id_token(claims: dict, algorithm: str, 
-                    secret_key: bytes) -> str:
-    \"\"\"Create signed ID token.
-    
-    Args:
-        claims: Token payload (sub, iss, aud, exp, etc.)
-        algorithm: PQ signature algorithm
-        secret_key: Signing key
-        
-    Returns:
-        Encoded JWT string
-    \"\"\"
+"""
     
-def verify_id_token(token: str, public_key: bytes, 
-                   algorithm: str) -> dict:
-    \"\"\"Verify and decode ID token.
+    content += _render_api_reference()
     
-    Args:
-        token: Encoded JWT string
-        public_key: Verification key
-        algorithm: Expected signature algorithm
-        
-    Returns:
-        Decoded claims dictionary
-        
-    Raises:
-        ValueError: If signature invalid or token expired
-    \"\"\"
-```
-
+    content += """
 ## Testing
 
 ### Test Coverage
@@ -814,43 +882,78 @@ compact_signer = FalconSigner(algorithm="Falcon-512")
 # Maximum security (e.g., financial transactions)
 secure_signer = DilithiumSigner(algorithm="ML-DSA-87")
 ```
-
+"""
+    
+    content += f"""
 ---
 
 **Document Version**: 1.0  
-**Last Updated**: {datetime.now().strftime("%B %d, %Y")}  
+**Last Updated**: {today}  
 **License**: [Specify your license]
 """
     
     return content
 
-def generate_pdf(output_file="TechnicalDocumentation.pdf"):
-    """Generate PDF from combined markdown."""
+def generate_pdf(output_file="TechnicalDocumentation.pdf", draft=False, unicode=False):
+    """Generate PDF from combined markdown.
+
+    When ``draft`` is set, the document is rendered with xelatex and
+    xdvipdfmx compression is disabled, which skips the dominant cost of
+    the LaTeX pipeline for preview builds. Unless ``unicode`` is set,
+    diagram glyphs are converted to ASCII and emoji are dropped.
+    """
     
     print("Creating combined markdown documentation...")
     content = create_combined_markdown()
+    if not unicode:
+        content = _box_drawing_to_ascii(content)
+    
+    cache_path = _cache_path(content, draft)
+    if _restore_cached_pdf(cache_path, output_file):
+        print(f"✅ PDF unchanged, restored from cache: {output_file}")
+        return True
     
     # Write to temporary markdown file
     temp_md = "temp_technical_doc.md"
-    with open(temp_md, "w") as f:
-        f.write(content)
+    Path(temp_md).write_bytes(content.encode("utf-8"))
+    
+    # Render to a sibling temp path (keeping the extension so pandoc still
+    # picks the PDF writer) and publish with an atomic rename on success.
+    root, ext = os.path.splitext(output_file)
+    tmp_pdf = f"{root}.tmp{ext}"
+    pandoc_log = "pandoc.log"
     
     print(f"Converting to PDF using pandoc...")
     
-    # Try pandoc first
+    # Try pandoc first. This is a single conversion per run, so the CLI is
+    # invoked directly; `pandoc server` cannot render PDF output and would
+    # not amortize anything here.
     try:
-        result = subprocess.run([
+        cmd = [
             "pandoc",
             temp_md,
-            "-o", output_file,
-            "--pdf-engine=pdflatex",
+            "-o", tmp_pdf,
+            "--pdf-engine=xelatex" if draft else "--pdf-engine=pdflatex",
             "--toc",
             "--toc-depth=3",
             "--number-sections",
             "-V", "geometry:margin=1in",
             "-V", "fontsize=11pt",
             "-V", "documentclass=report"
-        ], capture_output=True, text=True, check=True)
+        ]
+        if draft:
+            cmd.append("--pdf-engine-opt=-output-driver=xdvipdfmx -z0")
+        
+        # pandoc's output is only interesting on failure: discard stdout and
+        # spool stderr to a log file instead of buffering it in memory.
+        with open(pandoc_log, "wb") as log:
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=log)
+        if result.returncode != 0:
+            print(f"❌ Error running pandoc: {Path(pandoc_log).read_text(errors='replace')}")
+            print(f"\\n Markdown file saved as: {temp_md}")
+            return False
+        os.replace(tmp_pdf, output_file)
+        _store_cached_pdf(output_file, cache_path)
         
         print(f"✅ PDF generated: {output_file}")
         os.remove(temp_md)
@@ -861,40 +964,21 @@ def generate_pdf(output_file="TechnicalDocumentation.pdf"):
         
         # Alternative: use markdown2 + pdfkit (requires wkhtmltopdf)
         try:
-            import markdown2
-            import pdfkit
+            markdown2 = _import_optional("markdown2")
+            pdfkit = _import_optional("pdfkit")
             
             html = markdown2.markdown(content, extras=["tables", "fenced-code-blocks"])
-            html_full = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <title>Technical Documentation</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; margin: 40px; }}
-                    h1 {{ color: #2c3e50; border-bottom: 2px solid #3498db; padding-bottom: 10px; }}
-                    h2 {{ color: #34495e; margin-top: 30px; }}
-                    code {{ background: #f4f4f4; padding: 2px 5px; border-radius: 3px; }}
-                    pre {{ background: #f4f4f4; padding: 15px; border-radius: 5px; overflow-x: auto; }}
-                    table {{ border-collapse: collapse; width: 100%; margin: 20px 0; }}
-                    th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-                    th {{ background-color: #3498db; color: white; }}
-                </style>
-            </head>
-            <body>
-                {html}
-            </body>
-            </html>
-            """
+            html_full = _HTML_TEMPLATE.substitute(body=html)
             
-            pdfkit.from_string(html_full, output_file)
+            pdfkit.from_string(html_full, tmp_pdf)
+            os.replace(tmp_pdf, output_file)
+            _store_cached_pdf(output_file, cache_path)
             print(f"✅ PDF generated: {output_file}")
             os.remove(temp_md)
             return True
             
-        except ImportError:
-            print("❌ Alternative libraries not available.")
+        except ImportError as e:
+            print(f"❌ Alternative libraries not available: {e}")
             print("\\nPlease install one of:")
             print("  1. pandoc + pdflatex: sudo apt-get install pandoc texlive-latex-base")
             print("  2. wkhtmltopdf: sudo apt-get install wkhtmltopdf")
@@ -902,14 +986,25 @@ def generate_pdf(output_file="TechnicalDocumentation.pdf"):
             print(f"\\n Markdown file saved as: {temp_md}")
             print("   You can manually convert it to PDF.")
             return False
-        
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Error running pandoc: {e.stderr}")
-        print(f"\\n Markdown file saved as: {temp_md}")
-        return False
+    
+    finally:
+        # Never leave a partially written PDF or a stale log behind; the
+        # markdown source is kept on failure so it can be converted manually.
+        for path in (tmp_pdf, pandoc_log):
+            if os.path.exists(path):
+                os.remove(path)
 
 if __name__ == "__main__":
-    success = generate_pdf()
+    parser = argparse.ArgumentParser(description="Generate the technical documentation PDF.")
+    parser.add_argument("-o", "--output", default="TechnicalDocumentation.pdf",
+                        help="Output PDF path (default: TechnicalDocumentation.pdf)")
+    parser.add_argument("--draft", action="store_true",
+                        help="Fast uncompressed preview build (xelatex + xdvipdfmx -z0)")
+    parser.add_argument("--unicode", action="store_true",
+                        help="Keep box-drawing/arrow/check-mark glyphs and emoji instead of ASCII")
+    args = parser.parse_args()
+    
+    success = generate_pdf(args.output, draft=args.draft, unicode=args.unicode)
     if not success:
         print("\\n⚠️  PDF generation failed, but you can:")
         print("   1. Install missing tools (see instructions above)")
@@ -5,22 +5,28 @@ Handles client-side KEMTLS handshake and encrypted communication
 
 import socket
 import logging
-import json
+import os
 from typing import Optional, Tuple
 
-import sys
-import os
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+if __name__ == "__main__":
+    # Running this file directly: make the project root importable
+    import sys
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from src.kemtls.protocol import (
     KEMTLSMessage,
     KEMTLSMessageType,
     KEMTLSCertificate,
     KEMTLSSession,
-    KEMTLSState
+    KEMTLSState,
+    pack_fields,
+    unpack_fields,
+    send_buffers,
+    recv_message,
+    configure_socket
 )
 from src.pq_crypto.kem import KyberKEM
-from src.pq_crypto.utils import generate_nonce, compute_sha256
+from src.pq_crypto.utils import generate_nonce, pooled_nonce
 
 logger = logging.getLogger(__name__)
 
@@ -50,18 +56,12 @@ class KEMTLSClient:
         kem_public_key = self.kem.generate_keypair()
         
         # Generate client nonce
-        client_nonce = generate_nonce(16)
-        
-        # Create CLIENT_HELLO payload
-        hello_payload = {
-            "kem_public_key": kem_public_key.hex(),
-            "nonce": client_nonce.hex(),
-            "supported_kem": self.kem_algorithm
-        }
+        client_nonce = pooled_nonce(16)
         
+        # Create CLIENT_HELLO payload: (kem_public_key, nonce, supported_kem)
         message = KEMTLSMessage(
             KEMTLSMessageType.CLIENT_HELLO,
-            json.dumps(hello_payload).encode('utf-8')
+            pack_fields(kem_public_key, client_nonce, self.kem_algorithm.encode('utf-8'))
         )
         
         logger.info("Created CLIENT_HELLO")
@@ -77,11 +77,8 @@ class KEMTLSClient:
         if message.msg_type != KEMTLSMessageType.SERVER_HELLO:
             raise ValueError("Expected SERVER_HELLO")
         
-        # Parse SERVER_HELLO payload
-        hello_data = json.loads(message.payload.decode('utf-8'))
-        kem_ciphertext = bytes.fromhex(hello_data['kem_ciphertext'])
-        server_nonce = bytes.fromhex(hello_data['nonce'])
-        cert_bytes = bytes.fromhex(hello_data['certificate'])
+        # Parse SERVER_HELLO payload: (kem_ciphertext, nonce, certificate)
+        kem_ciphertext, server_nonce, cert_bytes = unpack_fields(message.payload, 3)
         
         # Decrypt shared secret
         shared_secret = self.kem.decapsulate(kem_ciphertext)
@@ -107,21 +104,12 @@ class KEMTLSClient:
             raise RuntimeError("Session not ready")
         
         # Compute handshake hash
-        handshake_data = (
-            session.client_nonce +
-            session.server_nonce +
-            session.shared_secret
-        )
-        handshake_hash = compute_sha256(handshake_data)
-        
-        finished_payload = {
-            "handshake_hash": handshake_hash.hex(),
-            "status": "OK"
-        }
+        handshake_hash = session.compute_handshake_hash()
         
+        # Create finished payload: (handshake_hash, status)
         message = KEMTLSMessage(
             KEMTLSMessageType.CLIENT_FINISHED,
-            json.dumps(finished_payload).encode('utf-8')
+            pack_fields(handshake_hash, b"OK")
         )
         
         logger.info("Created CLIENT_FINISHED")
@@ -142,12 +130,13 @@ class KEMTLSClient:
         
         # Create socket and connect
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        configure_socket(sock)
         sock.connect((host, port))
         logger.info("TCP connection established")
         
         # Step 1: Send CLIENT_HELLO
         client_hello, kem_pk, client_nonce = self.create_client_hello()
-        self._send_message(sock, client_hello.serialize())
+        self._send_message(sock, client_hello)
         
         # Step 2: Receive SERVER_HELLO
         data = self._recv_message(sock)
@@ -165,22 +154,26 @@ class KEMTLSClient:
         if server_finished.msg_type != KEMTLSMessageType.SERVER_FINISHED:
             raise ValueError("Expected SERVER_FINISHED")
         
+        server_hash, _status = unpack_fields(server_finished.payload, 2)
+        if not session.verify_handshake_hash(server_hash):
+            raise ValueError("SERVER_FINISHED handshake hash mismatch")
+        
         # Step 4: Send CLIENT_FINISHED
         client_finished = self.create_client_finished(session)
-        self._send_message(sock, client_finished.serialize())
+        self._send_message(sock, client_finished)
         
         logger.info("KEMTLS handshake completed successfully!")
         self.session = session
         
         return sock, session
     
-    def _send_message(self, sock: socket.socket, data: bytes):
-        """Send data over socket"""
-        sock.sendall(data)
+    def _send_message(self, sock: socket.socket, message: KEMTLSMessage):
+        """Send a message as separate header and payload buffers"""
+        send_buffers(sock, message.serialize_iov())
     
-    def _recv_message(self, sock: socket.socket, buffer_size: int = 65536) -> bytes:
-        """Receive data from socket"""
-        return sock.recv(buffer_size)
+    def _recv_message(self, sock: socket.socket) -> bytearray:
+        """Receive exactly one framed message from socket"""
+        return recv_message(sock)
 
 
 def test_kemtls_client():
@@ -13,20 +13,29 @@ This implementation provides:
 - Forward secrecy
 - Mutual authentication (optional)
 - Post-quantum security
+
+Wire format:
+All binary values (KEM keys, ciphertexts, nonces, certificates, hashes)
+travel as raw bytes in length-prefixed fields (see pack_fields); nothing
+is hex- or base64-encoded on the handshake path.
 """
 
-import json
+import hashlib
+import hmac
+import socket
 import struct
 import logging
-from typing import Tuple, Optional, Dict
+import os
+from typing import Tuple, Optional, Sequence
 from enum import Enum
 
-import sys
-import os
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+if __name__ == "__main__":
+    # Running this file directly: make the project root importable
+    import sys
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from src.pq_crypto.kem import KyberKEM
-from src.pq_crypto.signature import DilithiumSigner
+from src.pq_crypto.signature import DilithiumSigner, get_verifier
 from src.pq_crypto.utils import (
     derive_session_keys,
     generate_nonce,
@@ -36,6 +45,36 @@ from src.pq_crypto.utils import (
 
 logger = logging.getLogger(__name__)
 
+# Socket buffer size large enough for a Dilithium-sized SERVER_HELLO in one send
+SOCKET_BUFFER_SIZE = 256 * 1024
+
+
+def configure_socket(sock: socket.socket):
+    """
+    Tune a handshake socket for small request/response messages
+    
+    Disables Nagle's algorithm (the handshake is strictly ping-pong, so
+    delayed small segments only add latency), requests immediate ACKs
+    where the platform supports it, and enlarges the kernel send/receive
+    buffers.
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if hasattr(socket, "TCP_QUICKACK"):  # Linux only
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+
+
+# Message header: type (1 byte) + payload length (4 bytes, big-endian)
+HEADER_FORMAT = '>BI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Upper bound on a payload length announced by a peer. The largest real
+# message, SERVER_HELLO with Kyber1024 ciphertext and an ML-DSA-87 signed
+# certificate, is under 12 KiB; anything bigger is rejected before any
+# buffer is allocated for it.
+MAX_MESSAGE_SIZE = 64 * 1024
+
 
 class KEMTLSMessageType(Enum):
     """KEMTLS message types"""
@@ -59,6 +98,41 @@ class KEMTLSState(Enum):
     CLOSED = 5
 
 
+def pack_fields(*fields: bytes) -> bytes:
+    """
+    Pack binary fields into a length-prefixed layout
+    
+    Each field is encoded as a 2-byte big-endian length followed by the raw
+    bytes, so handshake payloads carry keys and ciphertexts without any
+    text encoding.
+    """
+    return b"".join(
+        part for field in fields for part in (struct.pack('>H', len(field)), field)
+    )
+
+
+def unpack_fields(data: bytes, count: int) -> Tuple[bytes, ...]:
+    """
+    Unpack ``count`` length-prefixed fields produced by ``pack_fields``
+    
+    Raises:
+        ValueError: If the payload is truncated
+    """
+    view = memoryview(data)
+    offset = 0
+    fields = []
+    for _ in range(count):
+        if offset + 2 > len(view):
+            raise ValueError("Truncated field header")
+        (length,) = struct.unpack_from('>H', view, offset)
+        offset += 2
+        if offset + length > len(view):
+            raise ValueError("Truncated field")
+        fields.append(bytes(view[offset:offset + length]))
+        offset += length
+    return tuple(fields)
+
+
 class KEMTLSMessage:
     """
     KEMTLS Protocol Message
@@ -75,27 +149,100 @@ class KEMTLSMessage:
     
     def serialize(self) -> bytes:
         """Serialize message to bytes"""
-        msg_type_byte = struct.pack('B', self.msg_type.value)
-        length = struct.pack('>I', len(self.payload))
-        return msg_type_byte + length + self.payload
+        return struct.pack(HEADER_FORMAT, self.msg_type.value, len(self.payload)) + self.payload
+    
+    def serialize_iov(self) -> Tuple[bytes, bytes]:
+        """Serialize message as (header, payload) buffers for vectored I/O"""
+        return struct.pack(HEADER_FORMAT, self.msg_type.value, len(self.payload)), self.payload
     
     @classmethod
     def deserialize(cls, data: bytes) -> 'KEMTLSMessage':
-        """Deserialize message from bytes"""
-        if len(data) < 5:
+        """Deserialize message from bytes (payload is a memoryview into ``data``)"""
+        if len(data) < HEADER_SIZE:
             raise ValueError("Message too short")
         
-        msg_type_val = struct.unpack('B', data[0:1])[0]
+        msg_type_val, length = struct.unpack_from(HEADER_FORMAT, data, 0)
         msg_type = KEMTLSMessageType(msg_type_val)
-        length = struct.unpack('>I', data[1:5])[0]
         
-        if len(data) < 5 + length:
+        if len(data) < HEADER_SIZE + length:
             raise ValueError("Incomplete message")
         
-        payload = data[5:5+length]
+        # Zero-copy view into the received buffer; consumers that need
+        # owned bytes convert individual fields (see unpack_fields)
+        payload = memoryview(data)[HEADER_SIZE:HEADER_SIZE + length]
         return cls(msg_type, payload)
 
 
+def send_buffers(sock: socket.socket, buffers: Sequence[bytes]):
+    """
+    Send several buffers with vectored I/O (``sendmsg``) without joining them
+    
+    Falls back to a single ``sendall`` on platforms without ``sendmsg``.
+    """
+    if not hasattr(sock, "sendmsg"):
+        sock.sendall(b"".join(buffers))
+        return
+    
+    views = [memoryview(buf) for buf in buffers if len(buf)]
+    while views:
+        sent = sock.sendmsg(views)
+        # Drop fully sent buffers and trim a partially sent one
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if sent:
+            views[0] = views[0][sent:]
+
+
+def _recv_into_exact(sock: socket.socket, view: memoryview):
+    """Fill ``view`` completely from the socket"""
+    offset = 0
+    while offset < len(view):
+        received = sock.recv_into(view[offset:])
+        if not received:
+            raise ConnectionError(
+                f"Connection closed after {offset} of {len(view)} bytes"
+            )
+        offset += received
+
+
+def recv_exact(sock: socket.socket, length: int) -> bytearray:
+    """
+    Receive exactly ``length`` bytes from the socket
+    
+    Raises:
+        ConnectionError: If the peer closes the connection early
+    """
+    buf = bytearray(length)
+    _recv_into_exact(sock, memoryview(buf))
+    return buf
+
+
+def recv_message(sock: socket.socket) -> bytearray:
+    """
+    Receive one complete framed KEMTLS message (header + payload)
+    
+    Reads the 5-byte header first, then exactly the announced payload
+    length into a preallocated buffer, so messages are neither truncated
+    nor merged with the next one.
+    
+    Raises:
+        ValueError: If the announced length exceeds MAX_MESSAGE_SIZE
+        ConnectionError: If the peer closes the connection early
+    """
+    header = recv_exact(sock, HEADER_SIZE)
+    _, length = struct.unpack_from(HEADER_FORMAT, header, 0)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(
+            f"Message length {length} exceeds maximum of {MAX_MESSAGE_SIZE} bytes"
+        )
+    
+    buf = bytearray(HEADER_SIZE + length)
+    buf[:HEADER_SIZE] = header
+    _recv_into_exact(sock, memoryview(buf)[HEADER_SIZE:])
+    return buf
+
+
 class KEMTLSCertificate:
     """
     Simplified KEMTLS Certificate
@@ -112,33 +259,59 @@ class KEMTLSCertificate:
         self.kem_public_key = kem_public_key
         self.sig_public_key = sig_public_key
         self.signature = signature
+        self._tbs: Optional[bytes] = None
     
     def to_bytes(self) -> bytes:
-        """Serialize certificate"""
-        cert_dict = {
-            "subject": self.subject,
-            "kem_pk": self.kem_public_key.hex(),
-            "sig_pk": self.sig_public_key.hex(),
-        }
-        if self.signature:
-            cert_dict["signature"] = self.signature.hex()
-        return json.dumps(cert_dict).encode('utf-8')
+        """
+        Serialize certificate
+        
+        Format:
+        - Subject, KEM public key and signature public key lengths
+          (3 x 2 bytes, big-endian)
+        - Subject (UTF-8), KEM public key, signature public key
+        - Signature (remaining bytes, empty if unsigned)
+        """
+        subject = self.subject.encode('utf-8')
+        return b"".join([
+            struct.pack('>HHH', len(subject), len(self.kem_public_key), len(self.sig_public_key)),
+            subject,
+            self.kem_public_key,
+            self.sig_public_key,
+            self.signature or b"",
+        ])
     
     @classmethod
     def from_bytes(cls, data: bytes) -> 'KEMTLSCertificate':
         """Deserialize certificate"""
-        cert_dict = json.loads(data.decode('utf-8'))
-        signature = bytes.fromhex(cert_dict["signature"]) if "signature" in cert_dict else None
+        view = memoryview(data)
+        if len(view) < 6:
+            raise ValueError("Certificate too short")
+        subject_len, kem_pk_len, sig_pk_len = struct.unpack_from('>HHH', view, 0)
+        
+        offset = 6
+        kem_pk_start = offset + subject_len
+        sig_pk_start = kem_pk_start + kem_pk_len
+        signature_start = sig_pk_start + sig_pk_len
+        if len(view) < signature_start:
+            raise ValueError("Truncated certificate")
+        
+        signature = bytes(view[signature_start:])
         return cls(
-            subject=cert_dict["subject"],
-            kem_public_key=bytes.fromhex(cert_dict["kem_pk"]),
-            sig_public_key=bytes.fromhex(cert_dict["sig_pk"]),
-            signature=signature
+            subject=str(view[offset:kem_pk_start], 'utf-8'),
+            kem_public_key=bytes(view[kem_pk_start:sig_pk_start]),
+            sig_public_key=bytes(view[sig_pk_start:signature_start]),
+            signature=signature or None
         )
     
     def get_tbs_data(self) -> bytes:
-        """Get 'to be signed' data"""
-        return f"{self.subject}|{self.kem_public_key.hex()}|{self.sig_public_key.hex()}".encode()
+        """Get 'to be signed' data (computed once per certificate)"""
+        if self._tbs is None:
+            self._tbs = b"|".join([
+                self.subject.encode('utf-8'),
+                self.kem_public_key,
+                self.sig_public_key
+            ])
+        return self._tbs
     
     def sign(self, signer: DilithiumSigner):
         """Sign the certificate"""
@@ -150,10 +323,9 @@ class KEMTLSCertificate:
         if not self.signature:
             return False
         tbs = self.get_tbs_data()
-        from src.pq_crypto.signature import SignatureVerifier
-        verifier = SignatureVerifier(
-            algorithm="ML-DSA-44",  # TODO: Extract from cert
-            public_key=self.sig_public_key
+        verifier = get_verifier(
+            "ML-DSA-44",  # TODO: Extract from cert
+            self.sig_public_key
         )
         return verifier.verify(tbs, self.signature)
 
@@ -178,12 +350,28 @@ class KEMTLSSession:
         self.client_nonce = client_nonce
         self.server_nonce = server_nonce
         
-        context = client_nonce + server_nonce
         self.encryption_key, self.mac_key, self.iv = derive_session_keys(
-            shared_secret, context
+            shared_secret, client_nonce, server_nonce
         )
         logger.info("Session keys derived successfully")
     
+    def compute_handshake_hash(self) -> bytes:
+        """
+        Hash the handshake transcript (client nonce, server nonce, shared secret)
+        
+        Feeds each part to an incremental SHA-256 instead of concatenating
+        them into a temporary buffer first.
+        """
+        h = hashlib.sha256()
+        h.update(self.client_nonce)
+        h.update(self.server_nonce)
+        h.update(self.shared_secret)
+        return h.digest()
+    
+    def verify_handshake_hash(self, remote_hash: bytes) -> bool:
+        """Check a peer's FINISHED hash against ours in constant time"""
+        return hmac.compare_digest(self.compute_handshake_hash(), remote_hash)
+    
     def is_ready(self) -> bool:
         """Check if session is ready for encryption"""
         return all([
@@ -5,29 +5,63 @@ Handles server-side KEMTLS handshake and encrypted communication
 
 import socket
 import logging
-import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Callable, Tuple
 from dataclasses import dataclass
 
-import sys
-import os
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+if __name__ == "__main__":
+    # Running this file directly: make the project root importable
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from src.kemtls.protocol import (
     KEMTLSMessage,
     KEMTLSMessageType,
     KEMTLSCertificate,
     KEMTLSSession,
-    KEMTLSState
+    KEMTLSState,
+    pack_fields,
+    unpack_fields,
+    send_buffers,
+    recv_message,
+    configure_socket
 )
 from src.pq_crypto.kem import KyberKEM
 from src.pq_crypto.signature import DilithiumSigner
-from src.pq_crypto.utils import generate_nonce, compute_sha256
+from src.pq_crypto.utils import generate_nonce, pooled_nonce
 
 logger = logging.getLogger(__name__)
 
+# dataclass(slots=True) needs Python 3.10+; older interpreters get a plain frozen dataclass
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+# Seconds a peer may stay silent during the handshake before its worker
+# thread gives up on it
+HANDSHAKE_TIMEOUT = 10.0
 
-@dataclass
+
+# Encapsulation only uses the peer's public key, so one KyberKEM per
+# (thread, algorithm) can serve every KEMTLSServer in the process. Keypair-
+# holding instances (server KEM/signing keys, client ephemeral keys) carry
+# private state and stay per-object.
+_ENCAP_KEMS = threading.local()
+
+
+def _encapsulation_kem(algorithm: str) -> KyberKEM:
+    """Return the calling thread's shared encapsulation-only KEM for ``algorithm``"""
+    kems = getattr(_ENCAP_KEMS, "by_algorithm", None)
+    if kems is None:
+        kems = _ENCAP_KEMS.by_algorithm = {}
+    kem = kems.get(algorithm)
+    if kem is None:
+        kem = kems[algorithm] = KyberKEM(algorithm)
+    return kem
+
+
+@dataclass(frozen=True, **_SLOTS)
 class KEMTLSServerConfig:
     """KEMTLS Server Configuration"""
     host: str = "0.0.0.0"
@@ -62,6 +96,9 @@ class KEMTLSServer:
         )
         self.certificate.sign(self.signer)
         
+        # The certificate is immutable from here on; serialize it once
+        self._cert_wire = self.certificate.to_bytes()
+        
         logger.info(f"KEMTLS Server initialized with {self.config.kem_algorithm} and {self.config.signature_algorithm}")
         logger.info(f"Server certificate created for: {self.config.server_name}")
     
@@ -75,10 +112,8 @@ class KEMTLSServer:
         if message.msg_type != KEMTLSMessageType.CLIENT_HELLO:
             raise ValueError("Expected CLIENT_HELLO")
         
-        # Parse CLIENT_HELLO payload
-        hello_data = json.loads(message.payload.decode('utf-8'))
-        client_kem_pk = bytes.fromhex(hello_data['kem_public_key'])
-        client_nonce = bytes.fromhex(hello_data['nonce'])
+        # Parse CLIENT_HELLO payload: (kem_public_key, nonce, supported_kem)
+        client_kem_pk, client_nonce, _supported_kem = unpack_fields(message.payload, 3)
         
         logger.info(f"Received CLIENT_HELLO with {len(client_kem_pk)} byte KEM public key")
         
@@ -88,7 +123,7 @@ class KEMTLSServer:
         
         return session, client_kem_pk, client_nonce
     
-    def create_server_hello(self, client_kem_pk: bytes) -> Tuple[KEMTLSMessage, bytes, bytes]:
+    def create_server_hello(self, client_kem_pk: bytes) -> Tuple[KEMTLSMessage, bytes, bytes, bytes]:
         """
         Create SERVER_HELLO message
         
@@ -96,29 +131,23 @@ class KEMTLSServer:
             client_kem_pk: Client's KEM public key
             
         Returns:
-            Tuple of (message, kem_ciphertext, shared_secret)
+            Tuple of (message, kem_ciphertext, shared_secret, server_nonce)
         """
         # Encapsulate shared secret using client's public key
-        kem_ciphertext, shared_secret = self.kem.encapsulate(client_kem_pk)
+        kem_ciphertext, shared_secret = _encapsulation_kem(self.config.kem_algorithm).encapsulate(client_kem_pk)
         
         # Generate server nonce
-        server_nonce = generate_nonce(16)
-        
-        # Create SERVER_HELLO payload
-        hello_payload = {
-            "kem_ciphertext": kem_ciphertext.hex(),
-            "nonce": server_nonce.hex(),
-            "certificate": self.certificate.to_bytes().hex()
-        }
+        server_nonce = pooled_nonce(16)
         
+        # Create SERVER_HELLO payload: (kem_ciphertext, nonce, certificate)
         message = KEMTLSMessage(
             KEMTLSMessageType.SERVER_HELLO,
-            json.dumps(hello_payload).encode('utf-8')
+            pack_fields(kem_ciphertext, server_nonce, self._cert_wire)
         )
         
         logger.info("Created SERVER_HELLO with encapsulated secret")
         
-        return message, kem_ciphertext, shared_secret
+        return message, kem_ciphertext, shared_secret, server_nonce
     
     def create_server_finished(self, session: KEMTLSSession) -> KEMTLSMessage:
         """
@@ -129,22 +158,12 @@ class KEMTLSServer:
             raise RuntimeError("Session not ready")
         
         # Compute handshake hash
-        handshake_data = (
-            session.client_nonce +
-            session.server_nonce +
-            session.shared_secret
-        )
-        handshake_hash = compute_sha256(handshake_data)
-        
-        # Create finished payload
-        finished_payload = {
-            "handshake_hash": handshake_hash.hex(),
-            "status": "OK"
-        }
+        handshake_hash = session.compute_handshake_hash()
         
+        # Create finished payload: (handshake_hash, status)
         message = KEMTLSMessage(
             KEMTLSMessageType.SERVER_FINISHED,
-            json.dumps(finished_payload).encode('utf-8')
+            pack_fields(handshake_hash, b"OK")
         )
         
         logger.info("Created SERVER_FINISHED")
@@ -161,26 +180,23 @@ class KEMTLSServer:
             Established KEMTLS session
         """
         logger.info("Starting KEMTLS handshake...")
+        configure_socket(client_socket)
         
         # Step 1: Receive CLIENT_HELLO
         data = self._recv_message(client_socket)
         client_hello = KEMTLSMessage.deserialize(data)
         session, client_kem_pk, client_nonce = self.handle_client_hello(client_hello)
         
-        # Step 2: Send SERVER_HELLO
-        server_hello, kem_ciphertext, shared_secret = self.create_server_hello(client_kem_pk)
-        self._send_message(client_socket, server_hello.serialize())
-        
-        # Get server nonce from message
-        hello_payload = json.loads(server_hello.payload.decode('utf-8'))
-        server_nonce = bytes.fromhex(hello_payload['nonce'])
+        # Step 2: Create SERVER_HELLO
+        server_hello, kem_ciphertext, shared_secret, server_nonce = self.create_server_hello(client_kem_pk)
         
         # Derive session keys
         session.derive_keys(shared_secret, client_nonce, server_nonce)
         
-        # Step 3: Send SERVER_FINISHED
+        # Step 3: Create SERVER_FINISHED; nothing is received in between, so
+        # both messages go out in a single vectored send
         server_finished = self.create_server_finished(session)
-        self._send_message(client_socket, server_finished.serialize())
+        self._send_message(client_socket, server_hello, server_finished)
         
         # Step 4: Receive CLIENT_FINISHED
         data = self._recv_message(client_socket)
@@ -189,16 +205,78 @@ class KEMTLSServer:
         if client_finished.msg_type != KEMTLSMessageType.CLIENT_FINISHED:
             raise ValueError("Expected CLIENT_FINISHED")
         
+        client_hash, _status = unpack_fields(client_finished.payload, 2)
+        if not session.verify_handshake_hash(client_hash):
+            raise ValueError("CLIENT_FINISHED handshake hash mismatch")
+        
         logger.info("KEMTLS handshake completed successfully!")
         return session
     
-    def _send_message(self, sock: socket.socket, data: bytes):
-        """Send data over socket"""
-        sock.sendall(data)
+    def serve_forever(
+        self,
+        handler: Optional[Callable[[socket.socket, KEMTLSSession], None]] = None,
+        max_workers: Optional[int] = None,
+        handshake_timeout: Optional[float] = HANDSHAKE_TIMEOUT
+    ):
+        """
+        Listen on the configured address and handshake with clients in parallel
+        
+        Each accepted connection is handed to a thread pool, so independent
+        handshakes (Kyber encapsulation, blocking socket reads) overlap
+        instead of being serialized on the accept loop. A connection holds
+        its worker for the handshake *and* the whole ``handler`` call, so at
+        most ``max_workers`` connections are served at once; size the pool
+        for long-lived handlers accordingly.
+        
+        Args:
+            handler: Called with (client_socket, session) after a successful
+                     handshake; the socket is closed when it returns. The
+                     socket still carries ``handshake_timeout``; call
+                     ``settimeout`` on it to change that.
+            max_workers: Worker threads (default: CPU count)
+            handshake_timeout: Per-operation socket timeout in seconds, so a
+                     silent peer cannot hold a worker forever (None disables)
+        """
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind((self.config.host, self.config.port))
+        server_socket.listen()
+        logger.info(f"KEMTLS Server listening on {self.config.host}:{self.config.port}")
+        
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            try:
+                while True:
+                    client_socket, client_address = server_socket.accept()
+                    client_socket.settimeout(handshake_timeout)
+                    executor.submit(self._handle_connection, client_socket, client_address, handler)
+            except KeyboardInterrupt:
+                logger.info("KEMTLS Server shutting down...")
+            finally:
+                server_socket.close()
+    
+    def _handle_connection(
+        self,
+        client_socket: socket.socket,
+        client_address: tuple,
+        handler: Optional[Callable[[socket.socket, KEMTLSSession], None]]
+    ):
+        """Run one handshake (and optional handler) on a worker thread"""
+        try:
+            session = self.perform_handshake(client_socket)
+            if handler:
+                handler(client_socket, session)
+        except Exception as e:
+            logger.error(f"Handshake with {client_address} failed: {e}")
+        finally:
+            client_socket.close()
+    
+    def _send_message(self, sock: socket.socket, *messages: KEMTLSMessage):
+        """Send one or more messages as header/payload buffers in one call"""
+        send_buffers(sock, [buf for message in messages for buf in message.serialize_iov()])
     
-    def _recv_message(self, sock: socket.socket, buffer_size: int = 65536) -> bytes:
-        """Receive data from socket"""
-        return sock.recv(buffer_size)
+    def _recv_message(self, sock: socket.socket) -> bytearray:
+        """Receive exactly one framed message from socket"""
+        return recv_message(sock)
 
 
 def test_kemtls_server():
@@ -224,7 +302,7 @@ def test_kemtls_server():
     client_kem = KyberKEM("Kyber512")
     client_pk = client_kem.generate_keypair()
     
-    server_hello, ciphertext, shared_secret = server.create_server_hello(client_pk)
+    server_hello, ciphertext, shared_secret, server_nonce = server.create_server_hello(client_pk)
     print(f"✓ Created SERVER_HELLO")
     print(f"  Ciphertext size: {len(ciphertext)} bytes")
     print(f"  Shared secret size: {len(shared_secret)} bytes")
@@ -234,7 +312,7 @@ def test_kemtls_server():
     session.derive_keys(
         shared_secret,
         generate_nonce(16),
-        generate_nonce(16)
+        server_nonce
     )
     
     server_finished = server.create_server_finished(session)
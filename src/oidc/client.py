@@ -5,14 +5,108 @@ This module implements an OpenID Connect client that can authenticate
 users with a PQ-OIDC server and verify PQ-signed ID tokens.
 """
 
-import secrets
+import base64
+import hashlib
+import hmac
 import json
-from typing import Dict, Optional, List
-from urllib.parse import urlencode, parse_qs, urlparse
+import os
+import struct
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, List, Tuple, Any
+from urllib.parse import urlencode, parse_qsl, urlsplit, quote_plus
+from urllib.request import urlopen
 
 from .pq_jwt import PQJWTHandler
 
 
+# Pending authorization flows only matter for the ~5 minute login window
+PENDING_STATE_TTL = 300
+PENDING_STATE_MAXSIZE = 100_000
+
+# Minted state layout: 16 random bytes + 8-byte issue time, then a 16-byte HMAC tag
+_STATE_RAW_SIZE = 24
+_STATE_TAG_SIZE = 16
+
+
+class _TTLCache:
+    """
+    Bounded mapping whose entries expire a fixed time after insertion.
+    
+    Entries are kept in insertion order, so with a constant TTL the oldest
+    entry is always the next to expire (or to be evicted when full).
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        
+    def _expire(self, now: float):
+        data = self._data
+        while data:
+            expires_at, _ = data[next(iter(data))]
+            if expires_at > now:
+                break
+            data.popitem(last=False)
+            
+    def __setitem__(self, key: str, value: Any):
+        now = time.monotonic()
+        self._expire(now)
+        self._data.pop(key, None)
+        self._data[key] = (now + self.ttl, value)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            
+    def __getitem__(self, key: str) -> Any:
+        expires_at, value = self._data[key]
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            raise KeyError(key)
+        return value
+        
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+        
+    def __len__(self) -> int:
+        self._expire(time.monotonic())
+        return len(self._data)
+        
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+            
+    def pop(self, key: str, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+
+@lru_cache(maxsize=128)
+def _discover_endpoints(issuer: str) -> Tuple[str, str, str]:
+    """
+    Fetch an issuer's discovery document and return its endpoints.
+    
+    Returns:
+        Tuple of (authorization, token, userinfo) endpoint URLs
+    """
+    with urlopen(f"{issuer}/.well-known/openid-configuration", timeout=10) as response:
+        metadata = json.loads(response.read())
+    return (
+        metadata["authorization_endpoint"],
+        metadata["token_endpoint"],
+        metadata.get("userinfo_endpoint", f"{issuer}/userinfo")
+    )
+
+
 class PQOIDCClient:
     """
     Post-Quantum OpenID Connect Client.
@@ -27,7 +121,9 @@ class PQOIDCClient:
         server_url: str,
         redirect_uri: str,
         jwt_handler: PQJWTHandler,
-        scope: Optional[List[str]] = None
+        scope: Optional[List[str]] = None,
+        endpoints: Optional[Tuple[str, str, str]] = None,
+        state_key: Optional[bytes] = None
     ):
         """
         Initialize OIDC client.
@@ -39,6 +135,10 @@ class PQOIDCClient:
             redirect_uri: Redirect URI for callbacks
             jwt_handler: PQ-JWT handler for token verification
             scope: List of scopes to request
+            endpoints: (authorization, token, userinfo) endpoint URLs;
+                derived from server_url if not provided
+            state_key: HMAC key for minted state values; share it between
+                processes that serve the same client (random if not provided)
         """
         self.client_id = client_id
         self.client_secret = client_secret
@@ -46,14 +146,87 @@ class PQOIDCClient:
         self.redirect_uri = redirect_uri
         self.jwt_handler = jwt_handler
         self.scope = scope or ["openid", "profile", "email"]
+        self._scope_str = " ".join(self.scope)
+        
+        # Endpoints (can be discovered via .well-known, see from_discovery)
+        if endpoints is None:
+            endpoints = (
+                f"{server_url}/authorize",
+                f"{server_url}/token",
+                f"{server_url}/userinfo"
+            )
+        self.authorization_endpoint, self.token_endpoint, self.userinfo_endpoint = endpoints
+        
+        # Static part of every authorization URL; only state/nonce vary
+        self._auth_url_prefix = f"{self.authorization_endpoint}?" + urlencode({
+            "response_type": "code",
+            "client_id": self.client_id,
+            "redirect_uri": self.redirect_uri,
+            "scope": self._scope_str
+        })
+        
+        # Encoded static token request fields; only the authorization code varies
+        self._token_body_prefix = urlencode({
+            "grant_type": "authorization_code",
+            "redirect_uri": self.redirect_uri,
+            "client_id": self.client_id,
+            "client_secret": self.client_secret
+        }).encode('ascii')
         
-        # Endpoints (can be discovered via .well-known)
-        self.authorization_endpoint = f"{server_url}/authorize"
-        self.token_endpoint = f"{server_url}/token"
-        self.userinfo_endpoint = f"{server_url}/userinfo"
+        # Minted state/nonce pairs are HMAC-bound and verified statelessly;
+        # only caller-supplied values are tracked in pending_states
+        self._state_key = state_key or os.urandom(32)
         
-        # State management for CSRF protection
-        self.pending_states: Dict[str, Dict] = {}
+        # State management for CSRF protection; abandoned flows expire
+        self.pending_states = _TTLCache(
+            maxsize=PENDING_STATE_MAXSIZE,
+            ttl=PENDING_STATE_TTL
+        )
+        
+        # Tags of minted states already exchanged, so each is single-use like
+        # a popped pending state; a minted state is dead PENDING_STATE_TTL
+        # after issue anyway, so entries need not outlive that
+        self._consumed_states = _TTLCache(
+            maxsize=PENDING_STATE_MAXSIZE,
+            ttl=PENDING_STATE_TTL
+        )
+        
+    @classmethod
+    def from_discovery(
+        cls,
+        issuer: str,
+        client_id: str,
+        client_secret: str,
+        redirect_uri: str,
+        jwt_handler: PQJWTHandler,
+        scope: Optional[List[str]] = None
+    ) -> "PQOIDCClient":
+        """
+        Create a client whose endpoints come from the issuer's discovery document.
+        
+        The document is fetched once per issuer and memoized, so clients for
+        the same issuer can be recreated cheaply.
+        
+        Args:
+            issuer: OIDC issuer URL
+            client_id: Client identifier
+            client_secret: Client secret
+            redirect_uri: Redirect URI for callbacks
+            jwt_handler: PQ-JWT handler for token verification
+            scope: List of scopes to request
+            
+        Returns:
+            Configured PQOIDCClient instance
+        """
+        return cls(
+            client_id=client_id,
+            client_secret=client_secret,
+            server_url=issuer,
+            redirect_uri=redirect_uri,
+            jwt_handler=jwt_handler,
+            scope=scope,
+            endpoints=_discover_endpoints(issuer.rstrip('/'))
+        )
         
     def get_authorization_url(
         self,
@@ -73,35 +246,101 @@ class PQOIDCClient:
             Authorization URL to redirect user to
         """
         # Generate state and nonce if not provided
-        if not state:
-            state = secrets.token_urlsafe(32)
-        if not nonce:
-            nonce = secrets.token_urlsafe(32)
-            
-        # Store state for validation
-        self.pending_states[state] = {
-            "nonce": nonce,
-            "redirect_uri": self.redirect_uri
-        }
+        if not state and not nonce:
+            state, nonce = self._mint_tokens()
+        else:
+            if not state or not nonce:
+                new_state, new_nonce = self._mint_tokens()
+                state = state or new_state
+                nonce = nonce or new_nonce
+                
+            # Store caller-supplied state for validation
+            self.pending_states[state] = {
+                "nonce": nonce,
+                "redirect_uri": self.redirect_uri
+            }
+        
+        # Fast path: append the per-request values to the cached prefix
+        if not additional_params:
+            return f"{self._auth_url_prefix}&state={quote_plus(state)}&nonce={quote_plus(nonce)}"
         
         # Build parameters
         params = {
             "response_type": "code",
             "client_id": self.client_id,
             "redirect_uri": self.redirect_uri,
-            "scope": " ".join(self.scope),
+            "scope": self._scope_str,
             "state": state,
             "nonce": nonce
         }
         
         # Add additional parameters
-        if additional_params:
-            params.update(additional_params)
+        params.update(additional_params)
             
         # Build URL
         auth_url = f"{self.authorization_endpoint}?{urlencode(params)}"
         return auth_url
         
+    def _mint_tokens(self) -> tuple:
+        """
+        Generate a self-verifying (state, nonce) pair.
+        
+        The state carries a random value and its issue time, tagged with an
+        HMAC under the client's state key; the nonce is derived from the same
+        value. Neither has to be stored to be validated later.
+        
+        Returns:
+            Tuple of (state, nonce) URL-safe strings
+        """
+        raw = os.urandom(16) + struct.pack('>Q', int(time.time()))
+        tag = hmac.new(self._state_key, b"state" + raw, hashlib.sha256).digest()
+        state = base64.urlsafe_b64encode(raw + tag[:_STATE_TAG_SIZE]).rstrip(b'=').decode('ascii')
+        return state, self._derive_nonce(raw)
+        
+    def _derive_nonce(self, raw: bytes) -> str:
+        """Derive the nonce bound to a minted state value."""
+        digest = hmac.new(self._state_key, b"nonce" + raw, hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:24]).decode('ascii')
+        
+    def _expected_nonce(self, state: str, consume: bool = False) -> Optional[str]:
+        """
+        Look up the nonce bound to a state value.
+        
+        Args:
+            state: State value from callback
+            consume: Mark the state as used, so later lookups fail
+            
+        Returns:
+            Expected nonce, or None if the state is unknown, forged, expired
+            or already consumed
+        """
+        state_data = self.pending_states.pop(state) if consume else self.pending_states.get(state)
+        if state_data is not None:
+            return state_data["nonce"]
+            
+        # Otherwise it must be a state minted by this client
+        try:
+            blob = base64.urlsafe_b64decode(state + '=' * (-len(state) % 4))
+        except ValueError:
+            return None
+        if len(blob) != _STATE_RAW_SIZE + _STATE_TAG_SIZE:
+            return None
+            
+        raw, tag = blob[:_STATE_RAW_SIZE], blob[_STATE_RAW_SIZE:]
+        expected = hmac.new(self._state_key, b"state" + raw, hashlib.sha256).digest()
+        if not hmac.compare_digest(tag, expected[:_STATE_TAG_SIZE]):
+            return None
+            
+        issued_at, = struct.unpack('>Q', raw[16:])
+        if time.time() - issued_at > PENDING_STATE_TTL:
+            return None
+        if tag in self._consumed_states:
+            return None
+        if consume:
+            self._consumed_states[tag] = True
+            
+        return self._derive_nonce(raw)
+        
     def validate_callback(
         self,
         callback_url: str
@@ -119,17 +358,16 @@ class PQOIDCClient:
             ValueError: If callback is invalid
         """
         # Parse callback URL
-        parsed = urlparse(callback_url)
-        params = parse_qs(parsed.query)
+        params = dict(parse_qsl(urlsplit(callback_url).query, keep_blank_values=True))
         
         # Extract parameters
-        code = params.get('code', [None])[0]
-        state = params.get('state', [None])[0]
-        error = params.get('error', [None])[0]
+        code = params.get('code')
+        state = params.get('state')
+        error = params.get('error')
         
         # Check for errors
         if error:
-            error_description = params.get('error_description', [''])[0]
+            error_description = params.get('error_description', '')
             raise ValueError(f"Authorization error: {error} - {error_description}")
             
         # Validate code and state
@@ -139,7 +377,7 @@ class PQOIDCClient:
             raise ValueError("State missing from callback")
             
         # Validate state (CSRF protection)
-        if state not in self.pending_states:
+        if self._expected_nonce(state) is None:
             raise ValueError("Invalid state - possible CSRF attack")
             
         return {"code": code, "state": state}
@@ -157,36 +395,27 @@ class PQOIDCClient:
             state: State value from callback
             
         Returns:
-            Dictionary with tokens:
-            - access_token: Access token
-            - token_type: Token type (usually "Bearer")
-            - expires_in: Token lifetime in seconds
-            - id_token: PQ-signed ID token
-            - scope: Granted scopes
+            Dictionary with:
+            - token_body: form-encoded token request body (bytes), ready
+              to POST to the token endpoint
+            - expected_nonce: Nonce the returned ID token must carry
             
         Raises:
             ValueError: If token exchange fails
         """
-        # Validate state
-        if state not in self.pending_states:
+        # Validate state; release a stored state immediately
+        expected_nonce = self._expected_nonce(state, consume=True)
+        if expected_nonce is None:
             raise ValueError("Invalid state")
-            
-        state_data = self.pending_states[state]
         
-        # Prepare token request
-        token_data = {
-            "grant_type": "authorization_code",
-            "code": code,
-            "redirect_uri": state_data["redirect_uri"],
-            "client_id": self.client_id,
-            "client_secret": self.client_secret
-        }
+        # Append the code to the precomputed static fields
+        token_body = self._token_body_prefix + b"&code=" + quote_plus(code).encode('ascii')
         
         # Note: In a real implementation, this would make an HTTP POST request
         # For our demo, we'll return a mock structure that the server will populate
         return {
-            "token_request": token_data,
-            "expected_nonce": state_data["nonce"]
+            "token_body": token_body,
+            "expected_nonce": expected_nonce
         }
         
     def verify_id_token(
@@ -207,7 +436,8 @@ class PQOIDCClient:
         Raises:
             ValueError: If token verification fails
         """
-        # Verify token signature and decode
+        # Verify token signature and decode (repeat presentations of a token
+        # are served from the JWT handler's verification cache)
         try:
             claims = self.jwt_handler.verify_jwt(
                 id_token,
@@ -225,6 +455,41 @@ class PQOIDCClient:
                 
         return claims
         
+    def verify_id_tokens(
+        self,
+        tokens: List[Tuple[str, Optional[str]]]
+    ) -> List[Dict]:
+        """
+        Verify and decode a batch of PQ-signed ID tokens.
+        
+        Signature checks are dispatched together through
+        PQJWTHandler.verify_batch so they run in parallel.
+        
+        Args:
+            tokens: List of (id_token, expected_nonce) pairs
+            
+        Returns:
+            Decoded token claims, in order
+            
+        Raises:
+            ValueError: If any token fails verification
+        """
+        try:
+            claims_list = self.jwt_handler.verify_batch(
+                [id_token for id_token, _ in tokens],
+                audience=self.client_id,
+                issuer=self.server_url
+            )
+        except Exception as e:
+            raise ValueError(f"Token verification failed: {e}")
+            
+        # Verify nonces where provided
+        for claims, (_, expected_nonce) in zip(claims_list, tokens):
+            if expected_nonce and claims.get("nonce") != expected_nonce:
+                raise ValueError("Nonce mismatch - possible replay attack")
+                
+        return claims_list
+        
     def get_user_info(self, access_token: str) -> Dict:
         """
         Get user information from userinfo endpoint.
@@ -290,3 +555,32 @@ def create_demo_client() -> PQOIDCClient:
     )
     
     return client
+
+
+def test_pq_oidc_client():
+    """Test state handling of the PQ-OIDC client"""
+    print("Testing PQ-OIDC Client...")
+    client = create_demo_client()
+    
+    for label, url in (
+        ("minted", client.get_authorization_url()),
+        ("caller-supplied", client.get_authorization_url(state="app-state", nonce="app-nonce")),
+    ):
+        state = dict(parse_qsl(urlsplit(url).query))["state"]
+        callback = client.validate_callback(f"{client.redirect_uri}?code=abc&state={quote_plus(state)}")
+        client.exchange_code_for_tokens(callback["code"], callback["state"])
+        print(f"  ✓ Exchanged code with {label} state")
+        
+        # A state is single-use: replaying it must fail
+        try:
+            client.exchange_code_for_tokens(callback["code"], callback["state"])
+        except ValueError:
+            print(f"  ✓ Replayed {label} state rejected")
+        else:
+            raise AssertionError(f"Replayed {label} state was accepted")
+    
+    print("\n✓ ALL PQ-OIDC CLIENT TESTS PASSED!")
+
+
+if __name__ == "__main__":
+    test_pq_oidc_client()
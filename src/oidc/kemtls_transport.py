@@ -5,18 +5,31 @@ This module integrates KEMTLS as a transport layer for OIDC communication,
 replacing traditional HTTPS/TLS with post-quantum KEMTLS.
 """
 
+import asyncio
 import json
+import os
 import socket
-import threading
-from typing import Dict, Optional, Callable, Any
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Callable, Any, Tuple
 from dataclasses import dataclass
+from urllib.parse import parse_qsl, urlsplit
 
-from ..kemtls.server import KEMTLSServer
+try:
+    import httptools  # Optional: native (llhttp) request parser
+except ImportError:
+    httptools = None
+
+from ..kemtls.server import KEMTLSServer, HANDSHAKE_TIMEOUT
 from ..kemtls.client import KEMTLSClient
 from ..kemtls.protocol import KEMTLSMessage
 
 
-@dataclass
+# dataclass(slots=True) needs Python 3.10+; older interpreters keep a __dict__
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_SLOTS)
 class HTTPRequest:
     """Parsed HTTP request."""
     method: str
@@ -26,7 +39,7 @@ class HTTPRequest:
     query_params: Dict[str, str]
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class HTTPResponse:
     """HTTP response structure."""
     status_code: int
@@ -35,6 +48,28 @@ class HTTPResponse:
     body: str
 
 
+# Encoded "HTTP/1.1 <code> <text>\r\n" lines, keyed by (code, text)
+_STATUS_LINES: Dict[tuple, bytes] = {}
+
+
+class _RequestCollector:
+    """Accumulates httptools parser callbacks for a single request."""
+    
+    def __init__(self):
+        self.url = b""
+        self.headers: Dict[str, str] = {}
+        self.body_parts: List[bytes] = []
+        
+    def on_url(self, url: bytes):
+        self.url += url
+        
+    def on_header(self, name: bytes, value: bytes):
+        self.headers[name.decode('utf-8').lower()] = value.decode('utf-8').strip()
+        
+    def on_body(self, body: bytes):
+        self.body_parts.append(body)
+
+
 class KEMTLSHTTPServer:
     """
     HTTP server that uses KEMTLS for transport security.
@@ -47,7 +82,8 @@ class KEMTLSHTTPServer:
         self,
         kemtls_server: KEMTLSServer,
         host: str = "127.0.0.1",
-        port: int = 5000
+        port: int = 5000,
+        timeout: float = HANDSHAKE_TIMEOUT
     ):
         """
         Initialize KEMTLS HTTP server.
@@ -56,14 +92,17 @@ class KEMTLSHTTPServer:
             kemtls_server: Configured KEMTLSServer instance
             host: Host to bind to
             port: Port to listen on
+            timeout: Seconds a client may stay silent during the handshake
+                     or before sending its request
         """
         self.kemtls_server = kemtls_server
         self.host = host
         self.port = port
-        self.routes: Dict[str, Callable] = {}
+        self.timeout = timeout
+        self.routes: Dict[Tuple[str, str], Callable] = {}
         self.running = False
         
-    def route(self, path: str, methods: list = None):
+    def route(self, path: str, methods: Optional[List[str]] = None):
         """
         Decorator to register route handlers.
         
@@ -74,15 +113,17 @@ class KEMTLSHTTPServer:
         if methods is None:
             methods = ["GET"]
             
-        def decorator(func):
+        def decorator(func: Callable) -> Callable:
             for method in methods:
-                route_key = f"{method}:{path}"
-                self.routes[route_key] = func
+                self.routes[(method, path)] = func
             return func
         return decorator
         
     def parse_http_request(self, data: bytes) -> HTTPRequest:
         """Parse HTTP request from bytes."""
+        if httptools is not None:
+            return self._parse_http_request_native(data)
+        
         try:
             # Decode and split into lines
             text = data.decode('utf-8')
@@ -97,7 +138,7 @@ class KEMTLSHTTPServer:
             # Split path and query
             if '?' in full_path:
                 path, query_string = full_path.split('?', 1)
-                query_params = dict(param.split('=') for param in query_string.split('&') if '=' in param)
+                query_params = dict(parse_qsl(query_string))
             else:
                 path = full_path
                 query_params = {}
@@ -126,27 +167,46 @@ class KEMTLSHTTPServer:
         except Exception as e:
             raise ValueError(f"Failed to parse HTTP request: {e}")
             
+    def _parse_http_request_native(self, data: bytes) -> HTTPRequest:
+        """Parse HTTP request with httptools, keeping the scan in native code."""
+        collector = _RequestCollector()
+        parser = httptools.HttpRequestParser(collector)
+        try:
+            parser.feed_data(data)
+            url = httptools.parse_url(collector.url)
+        except httptools.HttpParserError as e:
+            raise ValueError(f"Failed to parse HTTP request: {e}")
+            
+        return HTTPRequest(
+            method=parser.get_method().decode('ascii'),
+            path=url.path.decode('utf-8'),
+            headers=collector.headers,
+            body=b"".join(collector.body_parts).decode('utf-8'),
+            query_params=dict(parse_qsl(url.query.decode('utf-8'))) if url.query else {}
+        )
+            
     def create_http_response(self, response: HTTPResponse) -> bytes:
         """Create HTTP response bytes."""
-        # Status line
-        response_lines = [
-            f"HTTP/1.1 {response.status_code} {response.status_text}"
-        ]
+        # Status line (cached per status code/text)
+        status_key = (response.status_code, response.status_text)
+        status_line = _STATUS_LINES.get(status_key)
+        if status_line is None:
+            status_line = f"HTTP/1.1 {response.status_code} {response.status_text}\r\n".encode('utf-8')
+            _STATUS_LINES[status_key] = status_line
+        parts = [status_line]
         
         # Headers
         for key, value in response.headers.items():
-            response_lines.append(f"{key}: {value}")
+            parts += (key.encode('utf-8'), b": ", str(value).encode('utf-8'), b"\r\n")
             
         # Empty line before body
-        response_lines.append("")
+        parts.append(b"\r\n")
         
         # Body
         if response.body:
-            response_lines.append(response.body)
+            parts.append(response.body.encode('utf-8'))
             
-        # Join with CRLF
-        response_text = '\r\n'.join(response_lines)
-        return response_text.encode('utf-8')
+        return b"".join(parts)
         
     def handle_request(self, request: HTTPRequest) -> HTTPResponse:
         """
@@ -159,8 +219,7 @@ class KEMTLSHTTPServer:
             HTTP response
         """
         # Find route handler
-        route_key = f"{request.method}:{request.path}"
-        handler = self.routes.get(route_key)
+        handler = self.routes.get((request.method, request.path))
         
         if not handler:
             return HTTPResponse(
@@ -181,22 +240,39 @@ class KEMTLSHTTPServer:
                 body=f"500 Internal Server Error: {e}"
             )
             
-    def handle_client_connection(self, client_socket: socket.socket, client_address: tuple):
+    async def handle_client_connection(
+        self,
+        client_socket: socket.socket,
+        client_address: tuple,
+        executor: ThreadPoolExecutor
+    ):
         """Handle a client connection over KEMTLS."""
+        loop = asyncio.get_running_loop()
         try:
-            # Perform KEMTLS handshake
+            # Perform KEMTLS handshake (blocking, CPU-bound) on the worker pool;
+            # the socket timeout keeps a silent client from pinning a worker
             print(f"[KEMTLS-HTTP] Client connected from {client_address}")
-            success, session = self.kemtls_server.perform_handshake(client_socket)
-            
-            if not success:
-                print(f"[KEMTLS-HTTP] Handshake failed for {client_address}")
+            client_socket.settimeout(self.timeout)
+            try:
+                session = await loop.run_in_executor(
+                    executor, self.kemtls_server.perform_handshake, client_socket
+                )
+            except Exception as e:
+                print(f"[KEMTLS-HTTP] Handshake failed for {client_address}: {e}")
                 return
+            client_socket.setblocking(False)
                 
             print(f"[KEMTLS-HTTP] KEMTLS handshake successful with {client_address}")
             
             # Receive HTTP request over KEMTLS
             # In real implementation, would decrypt using session keys
-            request_data = client_socket.recv(4096)
+            try:
+                request_data = await asyncio.wait_for(
+                    loop.sock_recv(client_socket, 4096), self.timeout
+                )
+            except asyncio.TimeoutError:
+                print(f"[KEMTLS-HTTP] No request from {client_address} within {self.timeout}s")
+                return
             
             if not request_data:
                 return
@@ -205,49 +281,61 @@ class KEMTLSHTTPServer:
             request = self.parse_http_request(request_data)
             print(f"[KEMTLS-HTTP] {request.method} {request.path}")
             
-            # Handle request
-            response = self.handle_request(request)
+            # Handle request off the event loop (e.g. /token signs an ID token)
+            response = await loop.run_in_executor(executor, self.handle_request, request)
             
             # Send HTTP response over KEMTLS
             # In real implementation, would encrypt using session keys
             response_data = self.create_http_response(response)
-            client_socket.sendall(response_data)
+            await loop.sock_sendall(client_socket, response_data)
             
         except Exception as e:
             print(f"[KEMTLS-HTTP] Error handling client: {e}")
         finally:
             client_socket.close()
             
-    def serve_forever(self):
-        """Start server and handle connections."""
+    async def _serve(self):
+        """Accept connections on the event loop and handle each as a task."""
+        loop = asyncio.get_running_loop()
+        
         # Create socket
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_socket.bind((self.host, self.port))
-        server_socket.listen(5)
+        server_socket.listen(128)
+        server_socket.setblocking(False)
         
         self.running = True
         print(f"[KEMTLS-HTTP] Server listening on {self.host}:{self.port}")
         print(f"[KEMTLS-HTTP] Using KEMTLS for transport security")
         
+        tasks = set()
         try:
-            while self.running:
-                # Accept connection
-                client_socket, client_address = server_socket.accept()
-                
-                # Handle in new thread
-                thread = threading.Thread(
-                    target=self.handle_client_connection,
-                    args=(client_socket, client_address)
-                )
-                thread.daemon = True
-                thread.start()
-                
-        except KeyboardInterrupt:
-            print("\n[KEMTLS-HTTP] Server shutting down...")
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                while self.running:
+                    # Accept connection
+                    client_socket, client_address = await loop.sock_accept(server_socket)
+                    
+                    # Handle as a task; keep a reference until it finishes
+                    task = loop.create_task(
+                        self.handle_client_connection(client_socket, client_address, executor)
+                    )
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
         finally:
             server_socket.close()
             self.running = False
+            
+    def serve_forever(self):
+        """Start server and handle connections."""
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            print("\n[KEMTLS-HTTP] Server shutting down...")
+
+
+# Headers KEMTLSHTTPClient.request always sets itself
+_CLIENT_FRAMING_HEADERS = frozenset({"Host", "Connection", "Content-Length"})
 
 
 class KEMTLSHTTPClient:
@@ -286,48 +374,34 @@ class KEMTLSHTTPClient:
             HTTP response
         """
         # Parse URL
-        if url.startswith('http://'):
-            url = url[7:]
-        elif url.startswith('https://'):
-            url = url[8:]
-            
-        parts = url.split('/', 1)
-        host_port = parts[0]
-        path = '/' + parts[1] if len(parts) > 1 else '/'
-        
-        if ':' in host_port:
-            host, port = host_port.split(':')
-            port = int(port)
-        else:
-            host = host_port
-            port = 5000
-            
-        # Build HTTP request
-        request_lines = [f"{method} {path} HTTP/1.1"]
-        
-        # Add headers
-        if headers is None:
-            headers = {}
-        headers['Host'] = host
-        headers['Connection'] = 'close'
-        
-        if body:
-            headers['Content-Length'] = str(len(body))
-            
-        for key, value in headers.items():
-            request_lines.append(f"{key}: {value}")
+        parsed = urlsplit(url if '://' in url else f"http://{url}")
+        host = parsed.hostname
+        port = parsed.port or 5000
+        path = parsed.path or '/'
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
             
-        request_lines.append("")
-        if body:
-            request_lines.append(body)
+        # Build HTTP request directly into one buffer
+        body_bytes = body.encode('utf-8') if body else b""
+        request_data = bytearray(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n".encode('utf-8'))
+        request_data += b"Connection: close\r\n"
+        if body_bytes:
+            request_data += b"Content-Length: %d\r\n" % len(body_bytes)
             
-        request_data = '\r\n'.join(request_lines).encode('utf-8')
+        # Add headers (the framing headers above always take precedence)
+        if headers:
+            for key, value in headers.items():
+                if key not in _CLIENT_FRAMING_HEADERS:
+                    request_data += f"{key}: {value}\r\n".encode('utf-8')
+                
+        request_data += b"\r\n"
+        request_data += body_bytes
         
         # Connect with KEMTLS
-        success, session, sock = self.kemtls_client.connect_and_handshake(host, port)
-        
-        if not success:
-            raise ConnectionError("KEMTLS handshake failed")
+        try:
+            sock, session = self.kemtls_client.connect_and_handshake(host, port)
+        except Exception as e:
+            raise ConnectionError(f"KEMTLS handshake failed: {e}")
             
         try:
             # Send request over KEMTLS
@@ -336,16 +410,19 @@ class KEMTLSHTTPClient:
             
             # Receive response
             # In real implementation, would decrypt using session keys
-            response_data = b""
+            buf = bytearray()
             while True:
-                chunk = sock.recv(4096)
+                chunk = sock.recv(65536)
                 if not chunk:
                     break
-                response_data += chunk
+                buf += chunk
                 
-            # Parse response
-            response_text = response_data.decode('utf-8')
-            lines = response_text.split('\r\n')
+            # Split head from body without decoding the whole response
+            head_end = buf.find(b"\r\n\r\n")
+            if head_end < 0:
+                head_end = len(buf)
+            lines = buf[:head_end].decode('latin-1').split('\r\n')
+            response_body = buf[head_end + 4:].decode('utf-8')
             
             # Parse status line
             status_line = lines[0]
@@ -355,16 +432,11 @@ class KEMTLSHTTPClient:
             
             # Parse headers
             response_headers = {}
-            i = 1
-            while i < len(lines) and lines[i]:
-                if ':' in lines[i]:
-                    key, value = lines[i].split(':', 1)
+            for line in lines[1:]:
+                if ':' in line:
+                    key, value = line.split(':', 1)
                     response_headers[key.strip()] = value.strip()
-                i += 1
-                
-            # Parse body
-            response_body = '\r\n'.join(lines[i + 1:]) if i + 1 < len(lines) else ""
-            
+                    
             return HTTPResponse(
                 status_code=status_code,
                 status_text=status_text,
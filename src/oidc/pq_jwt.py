@@ -3,21 +3,40 @@ Post-Quantum JWT (JSON Web Token) Implementation
 Replaces RSA/ECDSA signatures with post-quantum digital signatures
 """
 
+import hashlib
 import json
 import time
 import logging
-from typing import Dict, Any, Optional, Tuple
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+
+try:
+    import orjson  # Optional: faster JSON encoding/decoding of JWT segments
+except ImportError:
+    orjson = None
 
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-from src.pq_crypto.signature import DilithiumSigner, SignatureVerifier
-from src.pq_crypto.utils import base64url_encode, base64url_decode
+from src.pq_crypto.signature import DilithiumSigner, get_verifier
+from src.pq_crypto.utils import base64url_encode, base64url_encode_bytes, base64url_decode
 
 logger = logging.getLogger(__name__)
 
 
+if orjson is not None:
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+else:
+    def _json_dumps(obj: Any) -> bytes:
+        """Compact JSON encoding, matching orjson.dumps output format"""
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    
+    _json_loads = json.loads  # accepts UTF-8 bytes directly
+
+
 class PQJWTHandler:
     """
     Post-Quantum JWT Handler
@@ -39,14 +58,21 @@ class PQJWTHandler:
         "Falcon-512": "Falcon-512",
         "Falcon-1024": "Falcon-1024",
     }
+    _ALG_VALUES = frozenset(ALG_MAPPING.values())
+    
+    # Claims create_jwt always sets itself, in serialization order
+    _STANDARD_CLAIMS = frozenset({"iss", "sub", "aud", "iat", "exp", "nbf"})
     
-    def __init__(self, algorithm: str = "ML-DSA-44", issuer: str = "https://pq-oidc.example.com"):
+    def __init__(self, algorithm: str = "ML-DSA-44", issuer: str = "https://pq-oidc.example.com",
+                 verify_cache_size: int = 4096):
         """
         Initialize PQ-JWT handler
         
         Args:
             algorithm: Post-quantum signature algorithm
             issuer: Token issuer (OIDC server URL)
+            verify_cache_size: Number of signature-verified tokens to remember
+                (0 disables the cache)
         """
         if algorithm not in self.ALG_MAPPING:
             raise ValueError(f"Unsupported algorithm: {algorithm}")
@@ -56,6 +82,20 @@ class PQJWTHandler:
         self.signer = DilithiumSigner(algorithm)
         self.public_key: Optional[bytes] = None
         
+        # The header only depends on the algorithm, so encode it once
+        header = {"alg": self.ALG_MAPPING[algorithm], "typ": "JWT"}
+        self._header_encoded = base64url_encode(_json_dumps(header))
+        self._signing_prefix = f"{self._header_encoded}.".encode('ascii')
+        
+        # Serialized '{"iss":<issuer>' prefix for tokens from the default issuer
+        self._issuer_prefix = b'{"iss":' + _json_dumps(issuer)
+        
+        # LRU of payloads whose signature already verified, keyed by
+        # (BLAKE2b-128 of the token, public key); claims are re-checked on hit
+        self.verify_cache_size = verify_cache_size
+        self._verify_cache: "OrderedDict[Tuple[bytes, bytes], Dict[str, Any]]" = OrderedDict()
+        self._verify_cache_lock = threading.Lock()
+        
         logger.info(f"PQ-JWT Handler initialized with {algorithm}")
     
     def generate_keypair(self) -> bytes:
@@ -74,7 +114,8 @@ class PQJWTHandler:
                    subject: str,
                    audience: str,
                    expires_in: int = 3600,
-                   additional_claims: Optional[Dict[str, Any]] = None) -> str:
+                   additional_claims: Optional[Dict[str, Any]] = None,
+                   now: Optional[int] = None) -> str:
         """
         Create a PQ-signed JWT
         
@@ -85,6 +126,7 @@ class PQJWTHandler:
             audience: Token audience (aud)
             expires_in: Expiration time in seconds
             additional_claims: Additional JWT claims
+            now: Issue time in seconds (sampled if not provided)
             
         Returns:
             Signed JWT string
@@ -92,52 +134,69 @@ class PQJWTHandler:
         if not self.public_key:
             raise RuntimeError("No keypair generated. Call generate_keypair() first")
         
-        # Create header
-        header = {
-            "alg": self.ALG_MAPPING[self.algorithm],
-            "typ": "JWT"
-        }
-        
         # Create payload with standard claims
-        current_time = int(time.time())
-        jwt_payload = {
-            "iss": issuer,
-            "sub": subject,
-            "aud": audience,
-            "iat": current_time,
-            "exp": current_time + expires_in,
-            "nbf": current_time,
-        }
-        
-        # Add custom payload
-        jwt_payload.update(payload)
-        
-        # Add additional claims if provided
-        if additional_claims:
-            jwt_payload.update(additional_claims)
-        
-        # Encode header and payload
-        header_encoded = base64url_encode(json.dumps(header, separators=(',', ':')).encode('utf-8'))
-        payload_encoded = base64url_encode(json.dumps(jwt_payload, separators=(',', ':')).encode('utf-8'))
-        
-        # Create signing input
-        signing_input = f"{header_encoded}.{payload_encoded}"
+        current_time = int(time.time()) if now is None else now
+        extra_claims = {**payload, **additional_claims} if additional_claims else payload
+        payload_bytes = self._encode_claims(
+            issuer, subject, audience, current_time, expires_in, extra_claims
+        )
+        
+        # Create signing input directly as bytes from the pre-encoded "<header>." prefix
+        signing_input = self._signing_prefix + base64url_encode_bytes(payload_bytes)
         
         # Sign
-        signature = self.signer.sign(signing_input.encode('utf-8'))
-        signature_encoded = base64url_encode(signature)
+        signature = self.signer.sign(signing_input)
         
-        # Create JWT
-        jwt = f"{signing_input}.{signature_encoded}"
+        # Create JWT (segments stay bytes until the final ASCII decode)
+        jwt = b".".join((signing_input, base64url_encode_bytes(signature))).decode('ascii')
         
         logger.info(f"Created PQ-JWT for subject={subject}, expires_in={expires_in}s")
         return jwt
     
+    def _encode_claims(self, issuer: str, subject: str, audience: str,
+                       current_time: int, expires_in: int,
+                       extra_claims: Dict[str, Any]) -> bytes:
+        """
+        Serialize the JWT claims set
+        
+        The standard claims are spliced into a byte template (with the
+        issuer prefix precomputed for the handler's own issuer), so only
+        the custom claims go through the JSON encoder. Custom claims that
+        override a standard claim fall back to building the full dict.
+        """
+        if not self._STANDARD_CLAIMS.isdisjoint(extra_claims):
+            claims = {
+                "iss": issuer,
+                "sub": subject,
+                "aud": audience,
+                "iat": current_time,
+                "exp": current_time + expires_in,
+                "nbf": current_time,
+            }
+            claims.update(extra_claims)
+            return _json_dumps(claims)
+        
+        prefix = self._issuer_prefix if issuer == self.issuer else b'{"iss":' + _json_dumps(issuer)
+        parts = [
+            prefix,
+            b',"sub":', _json_dumps(subject),
+            b',"aud":', _json_dumps(audience),
+            b',"iat":%d,"exp":%d,"nbf":%d' % (current_time, current_time + expires_in, current_time),
+        ]
+        if extra_claims:
+            # Splice the custom claims object in without its opening brace
+            parts.append(b',')
+            parts.append(_json_dumps(extra_claims)[1:])
+        else:
+            parts.append(b'}')
+        return b''.join(parts)
+    
     def create_id_token(self, user_id: str, 
                        client_id: str,
                        nonce: Optional[str] = None,
                        auth_time: Optional[int] = None,
-                       additional_claims: Optional[Dict[str, Any]] = None) -> str:
+                       additional_claims: Optional[Dict[str, Any]] = None,
+                       now: Optional[int] = None) -> str:
         """
         Create an OpenID Connect ID Token (PQ-signed)
         
@@ -147,10 +206,14 @@ class PQJWTHandler:
             nonce: Nonce from authentication request
             auth_time: Time of authentication
             additional_claims: Additional user claims
+            now: Issue time in seconds (sampled if not provided)
             
         Returns:
             Signed ID Token (JWT)
         """
+        if now is None:
+            now = int(time.time())
+        
         payload = {}
         
         if nonce:
@@ -159,17 +222,92 @@ class PQJWTHandler:
         if auth_time:
             payload["auth_time"] = auth_time
         else:
-            payload["auth_time"] = int(time.time())
+            payload["auth_time"] = now
         
         return self.create_jwt(
             payload=payload,
             issuer=self.issuer,
             subject=user_id,
             audience=client_id,
-            additional_claims=additional_claims
+            additional_claims=additional_claims,
+            now=now
         )
     
-    def verify_jwt(self, jwt: str, 
+    def _decode_signed_parts(self, jwt: Union[str, bytes]) -> Tuple[Dict[str, Any], Dict[str, Any], bytes, bytes]:
+        """
+        Split and decode a JWT without checking its signature
+        
+        Returns:
+            Tuple of (header, payload, signing_input, signature)
+        """
+        # Work on the ASCII bytes throughout; tokens read off the wire need no decoding
+        if isinstance(jwt, str):
+            try:
+                jwt = jwt.encode('ascii')
+            except UnicodeEncodeError:
+                raise ValueError("Invalid JWT format")
+        
+        # Locate the two separators; the signing input is everything before the second
+        first = jwt.find(b'.')
+        second = jwt.find(b'.', first + 1) if first >= 0 else -1
+        if second < 0 or jwt.find(b'.', second + 1) >= 0:
+            raise ValueError("Invalid JWT format")
+        
+        header_encoded = jwt[:first]
+        payload_encoded = jwt[first + 1:second]
+        signature_encoded = jwt[second + 1:]
+        
+        # Decode header
+        header_bytes = base64url_decode(header_encoded, validate=True)
+        header = _json_loads(header_bytes)
+        
+        # Check algorithm
+        if header.get('alg') not in self._ALG_VALUES:
+            raise ValueError(f"Unsupported algorithm: {header.get('alg')}")
+        
+        # Decode payload
+        payload_bytes = base64url_decode(payload_encoded, validate=True)
+        payload = _json_loads(payload_bytes)
+        
+        # Decode signature
+        signature = base64url_decode(signature_encoded, validate=True)
+        
+        signing_input = jwt[:second]
+        return header, payload, signing_input, signature
+    
+    @staticmethod
+    def _check_claims(payload: Dict[str, Any],
+                      verify_expiration: bool,
+                      audience: Optional[str],
+                      issuer: Optional[str]):
+        """Validate the time, audience and issuer claims of a verified payload"""
+        current_time = int(time.time()) if verify_expiration else 0
+        
+        # Happy path: one combined predicate; the checks below only run to
+        # report which claim failed
+        if ((not verify_expiration
+             or payload.get('nbf', 0) <= current_time <= payload.get('exp', 0))
+                and (not audience or payload.get('aud') == audience)
+                and (not issuer or payload.get('iss') == issuer)):
+            return
+        
+        # Verify expiration
+        if verify_expiration:
+            if payload.get('exp', 0) < current_time:
+                raise ValueError("Token expired")
+            
+            if payload.get('nbf', 0) > current_time:
+                raise ValueError("Token not yet valid")
+        
+        # Verify audience
+        if audience and payload.get('aud') != audience:
+            raise ValueError(f"Audience mismatch: expected {audience}, got {payload.get('aud')}")
+        
+        # Verify issuer
+        if issuer and payload.get('iss') != issuer:
+            raise ValueError(f"Issuer mismatch: expected {issuer}, got {payload.get('iss')}")
+    
+    def verify_jwt(self, jwt: Union[str, bytes], 
                    public_key: Optional[bytes] = None,
                    verify_expiration: bool = True,
                    audience: Optional[str] = None,
@@ -178,7 +316,7 @@ class PQJWTHandler:
         Verify a PQ-signed JWT
         
         Args:
-            jwt: JWT string
+            jwt: JWT string, or its ASCII bytes as received off the wire
             public_key: Public key to verify with (uses own if None)
             verify_expiration: Check if token is expired
             audience: Expected audience value
@@ -191,61 +329,43 @@ class PQJWTHandler:
             ValueError: If verification fails
         """
         try:
-            # Split JWT
-            parts = jwt.split('.')
-            if len(parts) != 3:
-                raise ValueError("Invalid JWT format")
-            
-            header_encoded, payload_encoded, signature_encoded = parts
-            
-            # Decode header
-            header_bytes = base64url_decode(header_encoded)
-            header = json.loads(header_bytes.decode('utf-8'))
-            
-            # Check algorithm
-            if header.get('alg') not in self.ALG_MAPPING.values():
-                raise ValueError(f"Unsupported algorithm: {header.get('alg')}")
-            
-            # Decode payload
-            payload_bytes = base64url_decode(payload_encoded)
-            payload = json.loads(payload_bytes.decode('utf-8'))
-            
-            # Decode signature
-            signature = base64url_decode(signature_encoded)
-            
-            # Verify signature
-            signing_input = f"{header_encoded}.{payload_encoded}"
             verify_key = public_key if public_key else self.public_key
             
             if not verify_key:
                 raise ValueError("No public key available for verification")
             
-            verifier = SignatureVerifier(
-                algorithm=header['alg'],
-                public_key=verify_key
-            )
+            # A token whose signature already verified under this key only
+            # needs its claims re-checked. A hit skips ML-DSA verification,
+            # so the key uses a collision-resistant 256-bit digest
+            cache_key = None
+            if self.verify_cache_size > 0:
+                token_bytes = jwt.encode('utf-8') if isinstance(jwt, str) else jwt
+                cache_key = (hashlib.sha256(token_bytes).digest(), verify_key)
+                with self._verify_cache_lock:
+                    cached = self._verify_cache.get(cache_key)
+                    if cached is not None:
+                        self._verify_cache.move_to_end(cache_key)
+                if cached is not None:
+                    self._check_claims(cached, verify_expiration, audience, issuer)
+                    return dict(cached)
+            
+            header, payload, signing_input, signature = self._decode_signed_parts(jwt)
             
-            is_valid = verifier.verify(signing_input.encode('utf-8'), signature)
+            # Verify signature
+            verifier = get_verifier(header['alg'], verify_key)
+            
+            is_valid = verifier.verify(signing_input, signature)
             
             if not is_valid:
                 raise ValueError("Signature verification failed")
             
-            # Verify expiration
-            if verify_expiration:
-                current_time = int(time.time())
-                if payload.get('exp', 0) < current_time:
-                    raise ValueError("Token expired")
-                
-                if payload.get('nbf', 0) > current_time:
-                    raise ValueError("Token not yet valid")
-            
-            # Verify audience
-            if audience and payload.get('aud') != audience:
-                raise ValueError(f"Audience mismatch: expected {audience}, got {payload.get('aud')}")
+            if cache_key is not None:
+                with self._verify_cache_lock:
+                    self._verify_cache[cache_key] = dict(payload)
+                    if len(self._verify_cache) > self.verify_cache_size:
+                        self._verify_cache.popitem(last=False)
             
-            # Verify issuer
-            if issuer and payload.get('iss') != issuer:
-                raise ValueError(f"Issuer mismatch: expected {issuer}, got {payload.get('iss')}")
+            self._check_claims(payload, verify_expiration, audience, issuer)
             
             logger.info("JWT verification successful")
             return payload
@@ -255,6 +375,68 @@ class PQJWTHandler:
         except Exception as e:
             raise ValueError(f"JWT verification error: {e}")
     
+    def verify_batch(self, jwts: Sequence[Union[str, bytes]],
+                     public_key: Optional[bytes] = None,
+                     verify_expiration: bool = True,
+                     audience: Optional[str] = None,
+                     issuer: Optional[str] = None,
+                     max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Verify several PQ-signed JWTs against the same key
+        
+        All tokens are decoded up front, then the signature checks are
+        handed to SignatureVerifier.verify_batch in one call per algorithm.
+        
+        Args:
+            jwts: JWT strings (or their ASCII bytes)
+            public_key: Public key to verify with (uses own if None)
+            verify_expiration: Check if tokens are expired
+            audience: Expected audience value
+            issuer: Expected issuer value
+            max_workers: Thread pool size (defaults to the executor's choice)
+            
+        Returns:
+            Decoded payload dictionaries, in order
+            
+        Raises:
+            ValueError: If any token fails verification
+        """
+        verify_key = public_key if public_key else self.public_key
+        if not verify_key:
+            raise ValueError("No public key available for verification")
+        
+        try:
+            decoded = [self._decode_signed_parts(jwt) for jwt in jwts]
+            
+            # Dispatch one batch per algorithm (normally just one)
+            indices_by_alg: Dict[str, List[int]] = {}
+            for index, (header, _, _, _) in enumerate(decoded):
+                indices_by_alg.setdefault(header['alg'], []).append(index)
+            
+            results = [False] * len(decoded)
+            for alg, indices in indices_by_alg.items():
+                verdicts = get_verifier(alg, verify_key).verify_batch(
+                    [decoded[i][2] for i in indices],
+                    [decoded[i][3] for i in indices],
+                    max_workers=max_workers
+                )
+                for index, is_valid in zip(indices, verdicts):
+                    results[index] = is_valid
+            
+            payloads = []
+            for index, (is_valid, (_, payload, _, _)) in enumerate(zip(results, decoded)):
+                if not is_valid:
+                    raise ValueError(f"Signature verification failed for token {index}")
+                self._check_claims(payload, verify_expiration, audience, issuer)
+                payloads.append(payload)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"JWT verification error: {e}")
+        
+        logger.info(f"Batch JWT verification successful ({len(payloads)} tokens)")
+        return payloads
+    
     def decode_jwt_unverified(self, jwt: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         """
         Decode JWT without verification (for inspection only)
@@ -272,10 +454,10 @@ class PQJWTHandler:
         header_encoded, payload_encoded, _ = parts
         
         header_bytes = base64url_decode(header_encoded)
-        header = json.loads(header_bytes.decode('utf-8'))
+        header = _json_loads(header_bytes)
         
         payload_bytes = base64url_decode(payload_encoded)
-        payload = json.loads(payload_bytes.decode('utf-8'))
+        payload = _json_loads(payload_bytes)
         
         return header, payload
 
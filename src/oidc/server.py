@@ -6,16 +6,27 @@ post-quantum cryptographic signatures for ID tokens. It provides
 standard OIDC endpoints while using PQ signatures instead of RSA/ECDSA.
 """
 
+import hashlib
+import heapq
+import hmac
 import json
+import os
 import secrets
+import sys
 import time
-from typing import Dict, Optional, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import Dict, Optional, List, Sequence, Tuple
 from dataclasses import dataclass, asdict
 from urllib.parse import urlencode, parse_qs, urlparse
 
 from .pq_jwt import PQJWTHandler
 
 
+# dataclass(slots=True) needs Python 3.10+; older interpreters keep a __dict__
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
 @dataclass
 class User:
     """User account information."""
@@ -26,6 +37,18 @@ class User:
     name: str
     given_name: str
     family_name: str
+    
+    @cached_property
+    def userinfo(self) -> Dict[str, object]:
+        """Standard UserInfo claims, built on first access (treat as read-only)."""
+        return {
+            "sub": self.user_id,
+            "name": self.name,
+            "given_name": self.given_name,
+            "family_name": self.family_name,
+            "email": self.email,
+            "email_verified": True,
+        }
 
 
 @dataclass
@@ -39,7 +62,7 @@ class Client:
     scope: List[str]
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class AuthorizationCode:
     """Temporary authorization code issued during authorization flow."""
     code: str
@@ -86,8 +109,12 @@ class PQOIDCServer:
         
         # In-memory storage (for demo - use DB in production)
         self.users: Dict[str, User] = {}
+        self.users_by_id: Dict[str, User] = {}
         self.clients: Dict[str, Client] = {}
+        self._client_secret_hashes: Dict[str, Tuple[str, bytes]] = {}  # client_id -> (secret, digest)
+        self._password_hashes: Dict[str, Tuple[str, bytes]] = {}  # username -> (password, digest)
         self.authorization_codes: Dict[str, AuthorizationCode] = {}
+        self._code_expiry_heap: List[Tuple[float, str]] = []  # (expires_at, code)
         self.sessions: Dict[str, str] = {}  # session_id -> user_id
         
         # Supported values
@@ -100,10 +127,30 @@ class PQOIDCServer:
     def register_user(self, user: User) -> None:
         """Register a user account."""
         self.users[user.username] = user
+        self.users_by_id[user.user_id] = user
+        self._stored_digest(self._password_hashes, user.username, user.password_hash)
         
     def register_client(self, client: Client) -> None:
         """Register an OIDC client application."""
         self.clients[client.client_id] = client
+        self._stored_digest(self._client_secret_hashes, client.client_id, client.client_secret)
+        
+    @staticmethod
+    def _hash_secret(secret: str) -> bytes:
+        """Fixed-size digest of a client secret or password for constant-time comparison."""
+        return hashlib.blake2b(secret.encode('utf-8'), digest_size=16).digest()
+        
+    def _stored_digest(self, digests: Dict[str, Tuple[str, bytes]], key: str, secret: str) -> bytes:
+        """
+        Digest of a stored secret, computed at registration and reused.
+        
+        Recomputed when the secret has changed since, or when the account
+        was added to the public dicts without going through register_*.
+        """
+        entry = digests.get(key)
+        if entry is None or entry[0] != secret:
+            entry = digests[key] = (secret, self._hash_secret(secret))
+        return entry[1]
         
     def authenticate_user(self, username: str, password: str) -> Optional[str]:
         """
@@ -120,8 +167,11 @@ class PQOIDCServer:
         if not user:
             return None
             
-        # Simple password check (use proper hashing in production!)
-        if user.password_hash == password:  # Demo only!
+        # Digest compare, prehashed at registration (use a real KDF in production!)
+        if hmac.compare_digest(
+            self._hash_secret(password),
+            self._stored_digest(self._password_hashes, username, user.password_hash)
+        ):
             return user.user_id
             
         return None
@@ -138,10 +188,7 @@ class PQOIDCServer:
         if not user_id:
             return None
             
-        for user in self.users.values():
-            if user.user_id == user_id:
-                return user
-        return None
+        return self.users_by_id.get(user_id)
         
     def handle_authorization_request(
         self,
@@ -240,32 +287,37 @@ class PQOIDCServer:
             expires_at=time.time() + self.code_lifetime
         )
         self.authorization_codes[code] = auth_code
+        heapq.heappush(self._code_expiry_heap, (auth_code.expires_at, code))
         return code
         
-    def handle_token_request(
+    def _prune_expired_codes(self, now: float) -> None:
+        """Drop authorization codes whose lifetime has passed."""
+        heap = self._code_expiry_heap
+        while heap and heap[0][0] < now:
+            _, code = heapq.heappop(heap)
+            self.authorization_codes.pop(code, None)
+        
+    def _redeem_authorization_code(
         self,
         grant_type: str,
         code: str,
         redirect_uri: str,
         client_id: str,
-        client_secret: str
-    ) -> Tuple[Optional[Dict], Optional[str]]:
+        client_secret: str,
+        now: float
+    ) -> Tuple[Optional[Tuple[AuthorizationCode, User]], Optional[str]]:
         """
-        Handle token endpoint request.
+        Validate a token request and consume its authorization code.
         
-        Args:
-            grant_type: OAuth grant type (must be "authorization_code")
-            code: Authorization code
-            redirect_uri: Redirect URI (must match authorization request)
-            client_id: Client identifier
-            client_secret: Client secret
-            
         Returns:
-            Tuple of (token_response, error)
+            Tuple of ((auth_code, user), error)
         """
         # Validate client credentials
         client = self.clients.get(client_id)
-        if not client or client.client_secret != client_secret:
+        if not client or not hmac.compare_digest(
+            self._hash_secret(client_secret),
+            self._stored_digest(self._client_secret_hashes, client_id, client.client_secret)
+        ):
             return None, "invalid_client"
             
         # Validate grant type
@@ -273,6 +325,7 @@ class PQOIDCServer:
             return None, "unsupported_grant_type"
             
         # Validate authorization code
+        self._prune_expired_codes(now)
         auth_code = self.authorization_codes.get(code)
         if not auth_code:
             return None, "invalid_grant"
@@ -280,7 +333,7 @@ class PQOIDCServer:
         if auth_code.used:
             return None, "invalid_grant"
             
-        if time.time() > auth_code.expires_at:
+        if now > auth_code.expires_at:
             return None, "invalid_grant"
             
         if auth_code.client_id != client_id:
@@ -293,19 +346,14 @@ class PQOIDCServer:
         auth_code.used = True
         
         # Get user
-        user = None
-        for u in self.users.values():
-            if u.user_id == auth_code.user_id:
-                user = u
-                break
-                
+        user = self.users_by_id.get(auth_code.user_id)
         if not user:
             return None, "invalid_grant"
             
-        # Generate tokens
-        now = time.time()
-        expires_in = self.token_lifetime
+        return (auth_code, user), None
         
+    def _sign_id_token(self, auth_code: AuthorizationCode, user: User, now: float) -> str:
+        """Build the scope-dependent claims and sign the ID token."""
         # Prepare additional claims based on scope
         additional_claims = {}
         
@@ -321,27 +369,106 @@ class PQOIDCServer:
             additional_claims["email_verified"] = True
             
         # Sign ID token with PQ signature
-        id_token = self.jwt_handler.create_id_token(
+        return self.jwt_handler.create_id_token(
             user_id=user.user_id,
-            client_id=client_id,
+            client_id=auth_code.client_id,
             nonce=auth_code.nonce,
             auth_time=int(now),
-            additional_claims=additional_claims
+            additional_claims=additional_claims,
+            now=int(now)
         )
         
+    def _build_token_response(self, auth_code: AuthorizationCode, id_token: str) -> Dict:
+        """Assemble the token endpoint response around a signed ID token."""
         # Generate access token (simplified - just a random token)
         access_token = secrets.token_urlsafe(32)
         
-        # Build response
-        token_response = {
+        return {
             "access_token": access_token,
             "token_type": "Bearer",
-            "expires_in": expires_in,
+            "expires_in": self.token_lifetime,
             "id_token": id_token,
             "scope": " ".join(auth_code.scope)
         }
         
-        return token_response, None
+    def handle_token_request(
+        self,
+        grant_type: str,
+        code: str,
+        redirect_uri: str,
+        client_id: str,
+        client_secret: str
+    ) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Handle token endpoint request.
+        
+        Args:
+            grant_type: OAuth grant type (must be "authorization_code")
+            code: Authorization code
+            redirect_uri: Redirect URI (must match authorization request)
+            client_id: Client identifier
+            client_secret: Client secret
+            
+        Returns:
+            Tuple of (token_response, error)
+        """
+        # Sample the clock once for the whole request
+        now = time.time()
+        
+        redeemed, error = self._redeem_authorization_code(
+            grant_type, code, redirect_uri, client_id, client_secret, now
+        )
+        if error:
+            return None, error
+            
+        auth_code, user = redeemed
+        id_token = self._sign_id_token(auth_code, user, now)
+        return self._build_token_response(auth_code, id_token), None
+        
+    def handle_token_requests(
+        self,
+        requests: Sequence[Dict[str, str]],
+        max_workers: Optional[int] = None
+    ) -> List[Tuple[Optional[Dict], Optional[str]]]:
+        """
+        Handle a batch of token endpoint requests.
+        
+        Codes are validated and consumed in order, then the ID tokens are
+        signed concurrently on a thread pool (liboqs signing runs outside
+        the GIL), so a burst of logins uses every core.
+        
+        Args:
+            requests: Token requests, each a dict with the keyword arguments
+                of handle_token_request
+            max_workers: Thread pool size (defaults to the CPU count)
+            
+        Returns:
+            List of (token_response, error) tuples, in request order
+        """
+        now = time.time()
+        
+        results: List[Tuple[Optional[Dict], Optional[str]]] = []
+        pending = []  # (result index, auth_code, user)
+        for request in requests:
+            redeemed, error = self._redeem_authorization_code(now=now, **request)
+            if error:
+                results.append((None, error))
+            else:
+                pending.append((len(results), *redeemed))
+                results.append((None, None))
+                
+        if not pending:
+            return results
+            
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            id_tokens = list(executor.map(
+                lambda item: self._sign_id_token(item[1], item[2], now), pending
+            ))
+            
+        for (index, auth_code, _), id_token in zip(pending, id_tokens):
+            results[index] = (self._build_token_response(auth_code, id_token), None)
+            
+        return results
         
     def handle_userinfo_request(self, access_token: str) -> Tuple[Optional[Dict], Optional[str]]:
         """
@@ -3,8 +3,10 @@ Post-Quantum Key Encapsulation Mechanism (KEM) Wrapper
 Uses Kyber from liboqs for quantum-resistant key exchange
 """
 
-from typing import Tuple, Optional
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
 import logging
+import time
 
 try:
     from oqs import KeyEncapsulation
@@ -14,8 +16,12 @@ except ImportError:
         "Install with: pip install liboqs-python"
     )
 
+from src.pq_crypto.utils import check_liboqs_simd, liboqs_cpu_features
+
 logger = logging.getLogger(__name__)
 
+_EMPTY_INFO: Mapping[str, int] = MappingProxyType({})
+
 
 class KyberKEM:
     """
@@ -25,6 +31,31 @@ class KyberKEM:
     
     SUPPORTED_ALGORITHMS = ["Kyber512", "Kyber768", "Kyber1024"]
     
+    # Static parameter table, shared by every get_algorithm_info call
+    _INFO = {
+        "Kyber512": MappingProxyType({
+            "security_level": 1,
+            "public_key_size": 800,
+            "secret_key_size": 1632,
+            "ciphertext_size": 768,
+            "shared_secret_size": 32,
+        }),
+        "Kyber768": MappingProxyType({
+            "security_level": 3,
+            "public_key_size": 1184,
+            "secret_key_size": 2400,
+            "ciphertext_size": 1088,
+            "shared_secret_size": 32,
+        }),
+        "Kyber1024": MappingProxyType({
+            "security_level": 5,
+            "public_key_size": 1568,
+            "secret_key_size": 3168,
+            "ciphertext_size": 1568,
+            "shared_secret_size": 32,
+        }),
+    }
+    
     def __init__(self, algorithm: str = "Kyber512"):
         """
         Initialize Kyber KEM
@@ -39,11 +70,12 @@ class KyberKEM:
             )
         
         self.algorithm = algorithm
+        check_liboqs_simd()
         self.kem = KeyEncapsulation(algorithm)
         self.public_key: Optional[bytes] = None
         self.secret_key: Optional[bytes] = None
         
-        logger.info(f"Initialized KyberKEM with {algorithm}")
+        logger.info("Initialized KyberKEM with %s", algorithm)
     
     def generate_keypair(self) -> bytes:
         """
@@ -53,7 +85,7 @@ class KyberKEM:
             Public key bytes
         """
         self.public_key = self.kem.generate_keypair()
-        logger.debug(f"Generated keypair, public key size: {len(self.public_key)} bytes")
+        logger.debug("Generated keypair, public key size: %d bytes", len(self.public_key))
         return self.public_key
     
     def encapsulate(self, public_key: bytes) -> Tuple[bytes, bytes]:
@@ -68,8 +100,8 @@ class KyberKEM:
         """
         ciphertext, shared_secret = self.kem.encap_secret(public_key)
         logger.debug(
-            f"Encapsulated secret - ciphertext: {len(ciphertext)} bytes, "
-            f"shared secret: {len(shared_secret)} bytes"
+            "Encapsulated secret - ciphertext: %d bytes, shared secret: %d bytes",
+            len(ciphertext), len(shared_secret)
         )
         return ciphertext, shared_secret
     
@@ -87,7 +119,7 @@ class KyberKEM:
             raise RuntimeError("No keypair generated. Call generate_keypair() first")
         
         shared_secret = self.kem.decap_secret(ciphertext)
-        logger.debug(f"Decapsulated secret: {len(shared_secret)} bytes")
+        logger.debug("Decapsulated secret: %d bytes", len(shared_secret))
         return shared_secret
     
     def get_public_key(self) -> bytes:
@@ -96,71 +128,100 @@ class KyberKEM:
             raise RuntimeError("No keypair generated")
         return self.public_key
     
+    def close(self):
+        """
+        Free the liboqs handle (and any secret key it holds)
+        
+        For one-shot keypairs whose secret key should not wait for garbage
+        collection. The instance must not be used afterwards.
+        """
+        if self.kem is None:
+            return
+        self.kem.free()
+        self.kem = None
+    
     @classmethod
-    def get_algorithm_info(cls, algorithm: str) -> dict:
+    def cpu_features(cls) -> Dict[str, bool]:
+        """
+        Get the ISA extensions liboqs detects on this CPU
+        
+        Lets operators confirm the AVX2/AVX-512/AES-NI fast paths are
+        available (see liboqs_cpu_features). Only meaningful for liboqs
+        builds with OQS_DIST_BUILD=ON; other builds (e.g. OQS_OPT_TARGET=
+        native) do no runtime detection and yield an empty mapping.
+        
+        Returns:
+            Mapping of extension name to availability (empty if unknown)
+        """
+        return dict(liboqs_cpu_features())
+    
+    @classmethod
+    def get_algorithm_info(cls, algorithm: str) -> Mapping[str, int]:
         """
         Get information about a specific Kyber algorithm
         
         Returns:
-            Dictionary with algorithm parameters
+            Read-only mapping of algorithm parameters (empty if unknown)
         """
-        info = {
-            "Kyber512": {
-                "security_level": 1,
-                "public_key_size": 800,
-                "secret_key_size": 1632,
-                "ciphertext_size": 768,
-                "shared_secret_size": 32,
-            },
-            "Kyber768": {
-                "security_level": 3,
-                "public_key_size": 1184,
-                "secret_key_size": 2400,
-                "ciphertext_size": 1088,
-                "shared_secret_size": 32,
-            },
-            "Kyber1024": {
-                "security_level": 5,
-                "public_key_size": 1568,
-                "secret_key_size": 3168,
-                "ciphertext_size": 1568,
-                "shared_secret_size": 32,
-            },
-        }
-        return info.get(algorithm, {})
+        return cls._INFO.get(algorithm, _EMPTY_INFO)
+
+
+def _run_kem_case(algo: str) -> dict:
+    """Run keygen/encapsulate/decapsulate for one algorithm and time each step"""
+    # Sender generates keypair
+    sender = KyberKEM(algo)
+    start = time.perf_counter_ns()
+    sender_public_key = sender.generate_keypair()
+    keygen_ns = time.perf_counter_ns() - start
+    
+    # Recipient encapsulates secret
+    recipient = KyberKEM(algo)
+    start = time.perf_counter_ns()
+    ciphertext, shared_secret_recipient = recipient.encapsulate(sender_public_key)
+    encap_ns = time.perf_counter_ns() - start
+    
+    # Sender decapsulates to recover secret
+    start = time.perf_counter_ns()
+    shared_secret_sender = sender.decapsulate(ciphertext)
+    decap_ns = time.perf_counter_ns() - start
+    
+    return {
+        "algo": algo,
+        "pk_size": len(sender_public_key),
+        "ct_size": len(ciphertext),
+        "ss_size": len(shared_secret_recipient),
+        "ok": shared_secret_sender == shared_secret_recipient,
+        "keygen_ns": keygen_ns,
+        "encap_ns": encap_ns,
+        "decap_ns": decap_ns,
+    }
 
 
 def test_kyber_kem():
     """Test basic Kyber KEM functionality"""
     print("Testing Kyber KEM...")
     
-    # Test Kyber512
-    for algo in ["Kyber512", "Kyber768", "Kyber1024"]:
-        print(f"\nTesting {algo}:")
-        
-        # Sender generates keypair
-        sender = KyberKEM(algo)
-        sender_public_key = sender.generate_keypair()
-        print(f"  ✓ Generated keypair")
-        print(f"    Public key size: {len(sender_public_key)} bytes")
-        
-        # Recipient encapsulates secret
-        recipient = KyberKEM(algo)
-        ciphertext, shared_secret_recipient = recipient.encapsulate(sender_public_key)
-        print(f"  ✓ Encapsulated shared secret")
-        print(f"    Ciphertext size: {len(ciphertext)} bytes")
-        print(f"    Shared secret size: {len(shared_secret_recipient)} bytes")
-        
-        # Sender decapsulates to recover secret
-        shared_secret_sender = sender.decapsulate(ciphertext)
-        print(f"  ✓ Decapsulated shared secret")
+    # Run the cases one after another so the printed timings are not skewed
+    # by contention, and report afterwards, keeping console output out of
+    # the timed operations
+    algos = ["Kyber512", "Kyber768", "Kyber1024"]
+    results = [_run_kem_case(algo) for algo in algos]
+    
+    for result in results:
+        print(f"\nTesting {result['algo']}:")
+        print(f"  ✓ Generated keypair ({result['keygen_ns'] / 1e6:.3f} ms)")
+        print(f"    Public key size: {result['pk_size']} bytes")
+        print(f"  ✓ Encapsulated shared secret ({result['encap_ns'] / 1e6:.3f} ms)")
+        print(f"    Ciphertext size: {result['ct_size']} bytes")
+        print(f"    Shared secret size: {result['ss_size']} bytes")
+        print(f"  ✓ Decapsulated shared secret ({result['decap_ns'] / 1e6:.3f} ms)")
         
         # Verify shared secrets match
-        assert shared_secret_sender == shared_secret_recipient, "Shared secrets don't match!"
+        assert result["ok"], "Shared secrets don't match!"
         print(f"  ✓ Shared secrets match!")
         
         # Print algorithm info
-        info = KyberKEM.get_algorithm_info(algo)
+        info = KyberKEM.get_algorithm_info(result["algo"])
         print(f"  Security level: NIST Level {info['security_level']}")
 
 
@@ -3,8 +3,13 @@ Post-Quantum Digital Signature Wrapper
 Uses Dilithium from liboqs for quantum-resistant signatures
 """
 
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Mapping, Optional, Sequence
+import hashlib
 import logging
+import time
 
 try:
     from oqs import Signature
@@ -14,8 +19,16 @@ except ImportError:
         "Install with: pip install liboqs-python"
     )
 
+from src.pq_crypto.utils import check_liboqs_simd
+
 logger = logging.getLogger(__name__)
 
+_EMPTY_INFO: Mapping[str, int] = MappingProxyType({})
+
+# Signing context for pre-hashed messages: keeps them in a separate domain
+# from plain sign(), whose context string is empty
+_PREHASH_CONTEXT = b"pq-oidc/prehash-sha256"
+
 
 class DilithiumSigner:
     """
@@ -34,6 +47,45 @@ class DilithiumSigner:
         "Falcon-1024",
     ]
     
+    # Static parameter table, shared by every get_algorithm_info call
+    _INFO = {
+        "ML-DSA-44": MappingProxyType({  # Dilithium2
+            "security_level": 2,
+            "public_key_size": 1312,
+            "secret_key_size": 2528,
+            "signature_size": 2420,
+            "nist_level": 2,
+        }),
+        "ML-DSA-65": MappingProxyType({  # Dilithium3
+            "security_level": 3,
+            "public_key_size": 1952,
+            "secret_key_size": 4000,
+            "signature_size": 3293,
+            "nist_level": 3,
+        }),
+        "ML-DSA-87": MappingProxyType({  # Dilithium5
+            "security_level": 5,
+            "public_key_size": 2592,
+            "secret_key_size": 4864,
+            "signature_size": 4595,
+            "nist_level": 5,
+        }),
+        "Falcon-512": MappingProxyType({
+            "security_level": 1,
+            "public_key_size": 897,
+            "secret_key_size": 1281,
+            "signature_size": 666,
+            "nist_level": 1,
+        }),
+        "Falcon-1024": MappingProxyType({
+            "security_level": 5,
+            "public_key_size": 1793,
+            "secret_key_size": 2305,
+            "signature_size": 1280,
+            "nist_level": 5,
+        }),
+    }
+    
     def __init__(self, algorithm: str = "ML-DSA-44"):
         """
         Initialize ML-DSA (Dilithium) signer
@@ -48,11 +100,12 @@ class DilithiumSigner:
             )
         
         self.algorithm = algorithm
+        check_liboqs_simd()
         self.signer = Signature(algorithm)
         self.public_key: Optional[bytes] = None
         self.secret_key: Optional[bytes] = None
         
-        logger.info(f"Initialized DilithiumSigner with {algorithm}")
+        logger.info("Initialized DilithiumSigner with %s", algorithm)
     
     def generate_keypair(self) -> bytes:
         """
@@ -62,7 +115,7 @@ class DilithiumSigner:
             Public key bytes
         """
         self.public_key = self.signer.generate_keypair()
-        logger.debug(f"Generated signing keypair, public key size: {len(self.public_key)} bytes")
+        logger.debug("Generated signing keypair, public key size: %d bytes", len(self.public_key))
         return self.public_key
     
     def sign(self, message: bytes) -> bytes:
@@ -79,7 +132,7 @@ class DilithiumSigner:
             raise RuntimeError("No keypair generated. Call generate_keypair() first")
         
         signature = self.signer.sign(message)
-        logger.debug(f"Signed message of {len(message)} bytes, signature: {len(signature)} bytes")
+        logger.debug("Signed message of %d bytes, signature: %d bytes", len(message), len(signature))
         return signature
     
     def verify(self, message: bytes, signature: bytes, public_key: Optional[bytes] = None) -> bool:
@@ -101,12 +154,71 @@ class DilithiumSigner:
         
         try:
             is_valid = self.signer.verify(message, signature, verify_key)
-            logger.debug(f"Signature verification: {'VALID' if is_valid else 'INVALID'}")
+            logger.debug("Signature verification: %s", "VALID" if is_valid else "INVALID")
             return is_valid
         except Exception as e:
             logger.error(f"Signature verification failed: {e}")
             return False
     
+    def sign_prehash(self, message: bytes) -> bytes:
+        """
+        Sign the SHA-256 digest of a message instead of the message itself
+        
+        Only the 32-byte digest crosses into liboqs, which keeps the cost of
+        signing large messages in OpenSSL's hash. The digest is signed under
+        a dedicated context string, so these signatures never verify with
+        verify() (or vice versa); the verifier must use verify_prehash.
+        (This is not FIPS 204 HashML-DSA, which liboqs does not expose.)
+        
+        Args:
+            message: Message bytes to sign
+        
+        Returns:
+            Signature bytes
+        
+        Raises:
+            ValueError: If the algorithm has no context-string support
+                        (only ML-DSA does; Falcon does not)
+        """
+        if not self.public_key:
+            raise RuntimeError("No keypair generated. Call generate_keypair() first")
+        self._require_context_support()
+        return self.signer.sign_with_ctx_str(hashlib.sha256(message).digest(), _PREHASH_CONTEXT)
+    
+    def verify_prehash(self, message: bytes, signature: bytes,
+                       public_key: Optional[bytes] = None) -> bool:
+        """
+        Verify a signature produced by sign_prehash
+        
+        Args:
+            message: Original message bytes
+            signature: Signature bytes
+            public_key: Public key to verify with (uses own if None)
+        
+        Returns:
+            True if signature is valid
+        
+        Raises:
+            ValueError: If the algorithm has no context-string support
+        """
+        verify_key = public_key if public_key else self.public_key
+        if not verify_key:
+            raise RuntimeError("No public key available for verification")
+        self._require_context_support()
+        
+        try:
+            return self.signer.verify_with_ctx_str(
+                hashlib.sha256(message).digest(), signature, _PREHASH_CONTEXT, verify_key
+            )
+        except Exception as e:
+            logger.error(f"Signature verification failed: {e}")
+            return False
+    
+    def _require_context_support(self):
+        """Raise ValueError unless liboqs signs with context strings for this algorithm"""
+        if not self.signer.details.get("sig_with_ctx_support"):
+            raise ValueError(f"{self.algorithm} does not support signing context strings")
+    
     def get_public_key(self) -> bytes:
         """Get the current public key"""
         if not self.public_key:
@@ -114,51 +226,14 @@ class DilithiumSigner:
         return self.public_key
     
     @classmethod
-    def get_algorithm_info(cls, algorithm: str) -> dict:
+    def get_algorithm_info(cls, algorithm: str) -> Mapping[str, int]:
         """
         Get information about a specific signature algorithm
         
         Returns:
-            Dictionary with algorithm parameters
-        """
-        info = {
-            "ML-DSA-44": {  # Dilithium2
-                "security_level": 2,
-                "public_key_size": 1312,
-                "secret_key_size": 2528,
-                "signature_size": 2420,
-                "nist_level": 2,
-            },
-            "ML-DSA-65": {  # Dilithium3
-                "security_level": 3,
-                "public_key_size": 1952,
-                "secret_key_size": 4000,
-                "signature_size": 3293,
-                "nist_level": 3,
-            },
-            "ML-DSA-87": {  # Dilithium5
-                "security_level": 5,
-                "public_key_size": 2592,
-                "secret_key_size": 4864,
-                "signature_size": 4595,
-                "nist_level": 5,
-            },
-            "Falcon-512": {
-                "security_level": 1,
-                "public_key_size": 897,
-                "secret_key_size": 1281,
-                "signature_size": 666,
-                "nist_level": 1,
-            },
-            "Falcon-1024": {
-                "security_level": 5,
-                "public_key_size": 1793,
-                "secret_key_size": 2305,
-                "signature_size": 1280,
-                "nist_level": 5,
-            },
-        }
-        return info.get(algorithm, {})
+            Read-only mapping of algorithm parameters (empty if unknown)
+        """
+        return cls._INFO.get(algorithm, _EMPTY_INFO)
 
 
 class SignatureVerifier:
@@ -178,7 +253,7 @@ class SignatureVerifier:
         self.algorithm = algorithm
         self.public_key = public_key
         self.verifier = Signature(algorithm)
-        logger.info(f"Initialized SignatureVerifier with {algorithm}")
+        logger.info("Initialized SignatureVerifier with %s", algorithm)
     
     def verify(self, message: bytes, signature: bytes) -> bool:
         """Verify a signature"""
@@ -188,48 +263,115 @@ class SignatureVerifier:
         except Exception as e:
             logger.error(f"Verification failed: {e}")
             return False
+    
+    def verify_batch(self, messages: Sequence[bytes], signatures: Sequence[bytes],
+                     max_workers: Optional[int] = None) -> List[bool]:
+        """
+        Verify several signatures under this public key
+        
+        liboqs verification runs outside the GIL, so the checks are spread
+        over a thread pool and scale with the available cores.
+        
+        Args:
+            messages: Original message bytes, one per signature
+            signatures: Signature bytes
+            max_workers: Thread pool size (defaults to the executor's choice)
+            
+        Returns:
+            Verification result for each signature, in order
+        """
+        if len(messages) != len(signatures):
+            raise ValueError("messages and signatures must have the same length")
+        if len(messages) <= 1:
+            return [self.verify(m, s) for m, s in zip(messages, signatures)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.verify, messages, signatures))
+
+
+@lru_cache(maxsize=256)
+def get_verifier(algorithm: str, public_key: bytes) -> SignatureVerifier:
+    """
+    Return a shared SignatureVerifier for (algorithm, public_key)
+    
+    Verification is stateless in liboqs, so one verifier per key can serve
+    every caller (including concurrent threads) instead of allocating a
+    new liboqs context for each signature check.
+    """
+    return SignatureVerifier(algorithm=algorithm, public_key=public_key)
+
+
+_TEST_MESSAGE = b"Post-Quantum OpenID Connect using KEMTLS"
+
+
+def _run_signature_case(algo: str) -> dict:
+    """Run keygen/sign/verify for one algorithm and time each step"""
+    # Generate keypair
+    signer = DilithiumSigner(algo)
+    start = time.perf_counter_ns()
+    public_key = signer.generate_keypair()
+    keygen_ns = time.perf_counter_ns() - start
+    
+    # Sign a message
+    start = time.perf_counter_ns()
+    signature = signer.sign(_TEST_MESSAGE)
+    sign_ns = time.perf_counter_ns() - start
+    
+    # Verify with signer's own key
+    start = time.perf_counter_ns()
+    valid_own = signer.verify(_TEST_MESSAGE, signature)
+    verify_ns = time.perf_counter_ns() - start
+    
+    # Verify with standalone verifier
+    verifier = SignatureVerifier(algo, public_key)
+    valid_standalone = verifier.verify(_TEST_MESSAGE, signature)
+    
+    # Test invalid signature
+    rejected = not signer.verify(b"Modified message", signature)
+    
+    return {
+        "algo": algo,
+        "pk_size": len(public_key),
+        "sig_size": len(signature),
+        "valid_own": valid_own,
+        "valid_standalone": valid_standalone,
+        "rejected": rejected,
+        "keygen_ns": keygen_ns,
+        "sign_ns": sign_ns,
+        "verify_ns": verify_ns,
+    }
 
 
 def test_dilithium_signatures():
     """Test basic ML-DSA (Dilithium) signature functionality"""
     print("Testing ML-DSA (Dilithium) Signatures...")
     
-    # Test all supported algorithms
-    for algo in ["ML-DSA-44", "ML-DSA-65", "ML-DSA-87", "Falcon-512", "Falcon-1024"]:
-        print(f"\nTesting {algo}:")
-        
-        # Generate keypair
-        signer = DilithiumSigner(algo)
-        public_key = signer.generate_keypair()
-        print(f"  ✓ Generated keypair")
-        print(f"    Public key size: {len(public_key)} bytes")
-        
-        # Sign a message
-        message = b"Post-Quantum OpenID Connect using KEMTLS"
-        signature = signer.sign(message)
-        print(f"  ✓ Signed message")
+    message = _TEST_MESSAGE
+    
+    # Run the cases one after another so the printed timings are not skewed
+    # by contention, and report afterwards, keeping console output out of
+    # the timed operations
+    algos = ["ML-DSA-44", "ML-DSA-65", "ML-DSA-87", "Falcon-512", "Falcon-1024"]
+    results = [_run_signature_case(algo) for algo in algos]
+    
+    for result in results:
+        print(f"\nTesting {result['algo']}:")
+        print(f"  ✓ Generated keypair ({result['keygen_ns'] / 1e6:.3f} ms)")
+        print(f"    Public key size: {result['pk_size']} bytes")
+        print(f"  ✓ Signed message ({result['sign_ns'] / 1e6:.3f} ms)")
         print(f"    Message size: {len(message)} bytes")
-        print(f"    Signature size: {len(signature)} bytes")
+        print(f"    Signature size: {result['sig_size']} bytes")
         
-        # Verify with signer's own key
-        is_valid = signer.verify(message, signature)
-        assert is_valid, "Signature verification failed!"
-        print(f"  ✓ Verified signature with signer's key")
+        assert result["valid_own"], "Signature verification failed!"
+        print(f"  ✓ Verified signature with signer's key ({result['verify_ns'] / 1e6:.3f} ms)")
         
-        # Verify with standalone verifier
-        verifier = SignatureVerifier(algo, public_key)
-        is_valid = verifier.verify(message, signature)
-        assert is_valid, "Standalone verification failed!"
+        assert result["valid_standalone"], "Standalone verification failed!"
         print(f"  ✓ Verified signature with standalone verifier")
         
-        # Test invalid signature
-        invalid_message = b"Modified message"
-        is_valid = signer.verify(invalid_message, signature)
-        assert not is_valid, "Invalid signature verified as valid!"
+        assert result["rejected"], "Invalid signature verified as valid!"
         print(f"  ✓ Correctly rejected invalid signature")
         
         # Print algorithm info
-        info = DilithiumSigner.get_algorithm_info(algo)
+        info = DilithiumSigner.get_algorithm_info(result["algo"])
         print(f"  Security level: NIST Level {info['nist_level']}")
 
 
@@ -5,8 +5,58 @@ Includes key derivation, encoding, and helper functions
 
 import hashlib
 import hmac
-import base64
-from typing import Tuple
+import binascii
+import logging
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, Tuple, Union
+
+try:
+    import pybase64  # Optional: SIMD-accelerated drop-in for base64
+except ImportError:
+    pybase64 = None
+
+try:
+    # Optional: OpenSSL-backed HKDF (single native call per expansion)
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
+except ImportError:
+    HKDFExpand = None
+
+logger = logging.getLogger(__name__)
+
+# Inputs shorter than this (JWT headers/payloads) are faster through binascii
+# directly; pybase64's dispatch overhead only pays off on larger blobs
+# such as signatures
+SIMD_BASE64_MIN_SIZE = 192
+
+_URLSAFE_ENCODE = bytes.maketrans(b'+/', b'-_')
+_URLSAFE_DECODE = bytes.maketrans(b'-_', b'+/')
+_BASE64URL_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+
+# HKDF block counters 0x00..0xff; slicing avoids building bytes([i]) per block
+_HKDF_COUNTERS = bytes(range(256))
+
+
+def base64url_encode_bytes(data: bytes) -> bytes:
+    """
+    Base64url encode data (URL-safe, no padding), keeping the ASCII bytes
+    
+    Lets callers that assemble larger byte strings (e.g. a JWT) skip the
+    per-segment str conversion and decode once at the end.
+    
+    Args:
+        data: Bytes to encode
+        
+    Returns:
+        Base64url encoded ASCII bytes
+    """
+    if pybase64 is not None and len(data) >= SIMD_BASE64_MIN_SIZE:
+        encoded = pybase64.urlsafe_b64encode(data)
+    else:
+        encoded = binascii.b2a_base64(data, newline=False).translate(_URLSAFE_ENCODE)
+    return encoded.rstrip(b'=')
 
 
 def base64url_encode(data: bytes) -> str:
@@ -20,24 +70,36 @@ def base64url_encode(data: bytes) -> str:
     Returns:
         Base64url encoded string
     """
-    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('utf-8')
+    return base64url_encode_bytes(data).decode('ascii')
 
 
-def base64url_decode(data: str) -> bytes:
+def base64url_decode(data: Union[str, bytes], validate: bool = False) -> bytes:
     """
     Base64url decode data
     
     Args:
-        data: Base64url encoded string
+        data: Base64url encoded string (or its ASCII bytes)
+        validate: Reject input containing characters outside the unpadded
+            base64url alphabet (by default they are skipped, as in base64)
         
     Returns:
         Decoded bytes
+        
+    Raises:
+        ValueError: If the input is malformed
     """
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    # Deleting every alphabet character leaves only the invalid ones
+    if validate and data.translate(None, _BASE64URL_ALPHABET):
+        raise ValueError("Invalid base64url data")
     # Add padding if needed
-    padding = 4 - (len(data) % 4)
-    if padding != 4:
-        data += '=' * padding
-    return base64.urlsafe_b64decode(data)
+    padding = -len(data) & 3
+    if padding:
+        data += b'=' * padding
+    if pybase64 is not None and len(data) >= SIMD_BASE64_MIN_SIZE:
+        return pybase64.urlsafe_b64decode(data)
+    return binascii.a2b_base64(data.translate(_URLSAFE_DECODE))
 
 
 def hkdf_extract(salt: bytes, input_key_material: bytes) -> bytes:
@@ -51,7 +113,7 @@ def hkdf_extract(salt: bytes, input_key_material: bytes) -> bytes:
     Returns:
         Pseudorandom key
     """
-    return hmac.new(salt, input_key_material, hashlib.sha256).digest()
+    return hmac.digest(salt, input_key_material, 'sha256')
 
 
 def hkdf_expand(prk: bytes, info: bytes, length: int) -> bytes:
@@ -66,21 +128,20 @@ def hkdf_expand(prk: bytes, info: bytes, length: int) -> bytes:
     Returns:
         Output keying material
     """
+    if HKDFExpand is not None:
+        return HKDFExpand(algorithm=hashes.SHA256(), length=length, info=info).derive(prk)
+    
     hash_len = 32  # SHA256 output length
     n = (length + hash_len - 1) // hash_len
     
-    okm = b""
+    okm = bytearray()
     previous = b""
     
     for i in range(1, n + 1):
-        previous = hmac.new(
-            prk,
-            previous + info + bytes([i]),
-            hashlib.sha256
-        ).digest()
-        okm += previous
+        previous = hmac.digest(prk, previous + info + _HKDF_COUNTERS[i:i + 1], 'sha256')
+        okm.extend(previous)
     
-    return okm[:length]
+    return bytes(okm[:length])
 
 
 def hkdf(salt: bytes, input_key_material: bytes, info: bytes, length: int) -> bytes:
@@ -101,28 +162,45 @@ def hkdf(salt: bytes, input_key_material: bytes, info: bytes, length: int) -> by
     return hkdf_expand(prk, info, length)
 
 
-def derive_session_keys(shared_secret: bytes, session_context: bytes) -> Tuple[bytes, bytes, bytes]:
+def derive_session_keys_mv(shared_secret: bytes,
+                           *session_context: bytes) -> Tuple[memoryview, memoryview, memoryview]:
     """
-    Derive session keys from KEM shared secret
+    Derive session keys as zero-copy views into one HKDF output buffer
+    
+    Same keys as derive_session_keys, without copying each key out of the
+    80-byte key material. The views keep that buffer alive.
     
     Args:
         shared_secret: Shared secret from KEM
-        session_context: Session-specific context (e.g., random nonces)
+        session_context: Session-specific context parts (e.g., client and
+                         server nonces), concatenated in order
         
     Returns:
-        Tuple of (encryption_key, mac_key, iv)
+        Tuple of (encryption_key, mac_key, iv) memoryviews
     """
     # Derive 80 bytes total: 32 for encryption, 32 for MAC, 16 for IV
     salt = b"KEMTLS-Session-Keys"
-    info = b"PQ-OIDC-v1|" + session_context
+    info = b"".join((b"PQ-OIDC-v1|",) + session_context)
     
-    key_material = hkdf(salt, shared_secret, info, 80)
+    key_material = memoryview(hkdf(salt, shared_secret, info, 80))
     
-    encryption_key = key_material[:32]
-    mac_key = key_material[32:64]
-    iv = key_material[64:80]
+    return key_material[:32], key_material[32:64], key_material[64:]
+
+
+def derive_session_keys(shared_secret: bytes, *session_context: bytes) -> Tuple[bytes, bytes, bytes]:
+    """
+    Derive session keys from KEM shared secret
     
-    return encryption_key, mac_key, iv
+    Args:
+        shared_secret: Shared secret from KEM
+        session_context: Session-specific context parts (e.g., client and
+                         server nonces), concatenated in order
+        
+    Returns:
+        Tuple of (encryption_key, mac_key, iv)
+    """
+    encryption_key, mac_key, iv = derive_session_keys_mv(shared_secret, *session_context)
+    return bytes(encryption_key), bytes(mac_key), bytes(iv)
 
 
 def compute_sha256(data: bytes) -> bytes:
@@ -162,14 +240,7 @@ def constant_time_compare(a: bytes, b: bytes) -> bool:
     Returns:
         True if equal
     """
-    if len(a) != len(b):
-        return False
-    
-    result = 0
-    for x, y in zip(a, b):
-        result |= x ^ y
-    
-    return result == 0
+    return hmac.compare_digest(a, b)
 
 
 def generate_random_bytes(length: int) -> bytes:
@@ -182,7 +253,6 @@ def generate_random_bytes(length: int) -> bytes:
     Returns:
         Random bytes
     """
-    import os
     return os.urandom(length)
 
 
@@ -199,6 +269,110 @@ def generate_nonce(length: int = 16) -> bytes:
     return generate_random_bytes(length)
 
 
+class _NoncePool:
+    """
+    Hands out random bytes from a buffer refilled with one os.urandom call
+    
+    Amortizes the getrandom syscall across many small nonce requests.
+    """
+    
+    def __init__(self, chunk: int = 4096):
+        self._chunk = chunk
+        self._lock = threading.Lock()
+        self._buf = b""
+        self._offset = 0
+    
+    def get(self, n: int) -> bytes:
+        """Return ``n`` fresh random bytes (never handed out twice)"""
+        if n > self._chunk:
+            return os.urandom(n)
+        with self._lock:
+            if self._offset + n > len(self._buf):
+                self._buf = os.urandom(self._chunk)
+                self._offset = 0
+            start = self._offset
+            self._offset += n
+            return self._buf[start:self._offset]
+    
+    def reset(self):
+        """Discard buffered bytes (a forked child must not reuse the parent's)"""
+        self._lock = threading.Lock()
+        self._buf = b""
+        self._offset = 0
+
+
+_NONCE_POOL = _NoncePool()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_NONCE_POOL.reset)
+
+
+def pooled_nonce(length: int = 16) -> bytes:
+    """
+    Generate a random nonce from the shared pre-fetched pool
+    
+    Suitable for high-rate handshake nonces; use generate_nonce when a
+    dedicated os.urandom call per value is required.
+    
+    Args:
+        length: Nonce length in bytes (default 16)
+        
+    Returns:
+        Random nonce
+    """
+    return _NONCE_POOL.get(length)
+
+
+# OQS_CPU_EXT enum values from liboqs' common.h
+_OQS_CPU_EXTENSIONS = {
+    "ADX": 1, "AES": 2, "AVX": 3, "AVX2": 4, "AVX512": 5, "BMI1": 6,
+    "BMI2": 7, "PCLMULQDQ": 8, "VPCLMULQDQ": 9, "POPCNT": 10,
+    "ARM_AES": 14, "ARM_SHA2": 15, "ARM_SHA3": 16, "ARM_NEON": 17,
+}
+
+
+@lru_cache(maxsize=None)
+def liboqs_cpu_features() -> Dict[str, bool]:
+    """
+    Report which ISA extensions liboqs detects on this CPU
+    
+    These decide whether liboqs can take its AVX2 Kyber/ML-DSA code paths
+    (NTT butterflies, Montgomery reduction, 4-way Keccak). liboqs only runs
+    this detection in distributable builds (OQS_DIST_BUILD=ON, the
+    default); other builds pick their code paths at compile time and report
+    every extension as absent. Such an all-False report is therefore
+    treated as unknown, as is a liboqs-python that does not expose the
+    native library: both return an empty dict.
+    """
+    import ctypes
+    import oqs
+    
+    native = getattr(oqs, "native", None) or getattr(getattr(oqs, "oqs", None), "native", None)
+    try:
+        has_extension = native().OQS_CPU_has_extension
+    except (TypeError, AttributeError, OSError):
+        return {}
+    has_extension.argtypes = [ctypes.c_int]
+    has_extension.restype = ctypes.c_int
+    features = {name: bool(has_extension(ext)) for name, ext in _OQS_CPU_EXTENSIONS.items()}
+    return features if any(features.values()) else {}
+
+
+@lru_cache(maxsize=None)
+def check_liboqs_simd():
+    """
+    Log once if a distributable liboqs build finds no AVX2/NEON on this CPU
+    
+    Only then is it known that the portable reference code will run; other
+    builds give no runtime report and are not warned about.
+    """
+    features = liboqs_cpu_features()
+    if features and not (features.get("AVX2") or features.get("ARM_NEON")):
+        logger.warning(
+            "liboqs reports no AVX2/NEON support on this CPU; Kyber and ML-DSA "
+            "will use the portable reference code."
+        )
+
+
 if __name__ == "__main__":
     # Test utilities
     print("Testing PQ Crypto Utilities...")
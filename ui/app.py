@@ -3,21 +3,76 @@ Simple Web UI for Post-Quantum OIDC Demo
 Demonstrates KEMTLS, OIDC flow, and benchmarks visually
 """
 
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session
+from flask import Flask, Response, render_template, jsonify, request, redirect, url_for, session, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from jinja2 import FileSystemBytecodeCache
+import hashlib
+import statistics
 import sys
 import os
 import json
+import queue
 import time
 import logging
+import threading
+from array import array
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+try:
+    import orjson  # Optional: C JSON encoder for API responses
+except ImportError:
+    orjson = None
+
+try:
+    from waitress import serve  # Optional: multi-threaded production WSGI server
+except ImportError:
+    serve = None
 
 # Suppress liboqs auto-install messages
 logging.getLogger('oqs').setLevel(logging.ERROR)
 
-# Add parent directory to path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Add parent directory to path (once, even if the module is loaded again)
+_PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
 
-# Set environment variable to use existing liboqs
-os.environ['OQS_INSTALL_DIR'] = '/usr/local'
+def _detect_liboqs_backend() -> Tuple[str, Optional[str]]:
+    """
+    Pick the most specific liboqs build this CPU can run
+    
+    Prefers /opt/liboqs-avx512 or /opt/liboqs-avx2 when that directory
+    exists and /proc/cpuinfo reports the matching flag. Returns (backend
+    name, install dir), with no dir when neither applies.
+    """
+    try:
+        with open('/proc/cpuinfo') as cpuinfo:
+            flags = next((line.split(':', 1)[1].split() for line in cpuinfo
+                          if line.startswith(('flags', 'Features'))), [])
+    except OSError:
+        flags = []
+    for backend, flag in (('avx512', 'avx512f'), ('avx2', 'avx2')):
+        install_dir = f'/opt/liboqs-{backend}'
+        if flag in flags and os.path.isdir(install_dir):
+            return backend, install_dir
+    return 'default', None
+
+
+# Use an ISA-tuned liboqs if one is installed and the environment does not
+# already point elsewhere; otherwise leave OQS_INSTALL_DIR unset so
+# liboqs-python finds (or installs) liboqs in its own default location
+LIBOQS_BACKEND, _liboqs_dir = _detect_liboqs_backend()
+if 'OQS_INSTALL_DIR' in os.environ:
+    LIBOQS_BACKEND = 'custom'
+elif _liboqs_dir is not None:
+    os.environ['OQS_INSTALL_DIR'] = _liboqs_dir
+
+
+def liboqs_backend_summary() -> str:
+    """Describe the liboqs build in use, e.g. for the startup banner"""
+    return f"{LIBOQS_BACKEND} ({os.environ.get('OQS_INSTALL_DIR', 'liboqs-python default location')})"
 
 from src.pq_crypto.kem import KyberKEM
 from src.pq_crypto.signature import DilithiumSigner
@@ -25,111 +80,339 @@ from src.oidc.pq_jwt import PQJWTHandler
 from src.oidc.server import PQOIDCServer
 from src.oidc.client import PQOIDCClient
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson
+    
+    Falls back to the stdlib encoder for pretty-printing (debug mode) and
+    for values orjson rejects, such as non-string keys or huge integers.
+    """
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs.get('indent') is None:
+            try:
+                option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+                return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+
 app = Flask(__name__)
 app.secret_key = 'demo-secret-key-not-for-production'
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+# Persist compiled templates so fresh workers skip Jinja compilation
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
 
-# Initialize JWT handler with PQ signature algorithm
-jwt_handler = PQJWTHandler(algorithm="ML-DSA-44", issuer="https://pq-oidc-demo.local")
-jwt_handler.generate_keypair()
-
-# Initialize OIDC components
-oidc_server = PQOIDCServer(
-    issuer="https://pq-oidc-demo.local",
-    jwt_handler=jwt_handler
-)
-
-# Add demo user and client
-from src.oidc.server import User
-demo_user = User(
-    user_id="demo_user_id",
-    username="demo_user",
-    password_hash="demo123",  # In production, use proper hashing
-    email="demo@example.com",
-    name="Demo User",
-    given_name="Demo",
-    family_name="User"
-)
-oidc_server.register_user(demo_user)
-
-# Register demo client
-import secrets
-from src.oidc.server import Client
-demo_client = Client(
-    client_id="demo_client_" + secrets.token_hex(8),
-    client_secret="demo_secret_" + secrets.token_hex(16),
-    redirect_uris=["http://localhost:5000/callback"],
-    grant_types=["authorization_code"],
-    response_types=["code"],
-    scope=["openid", "profile", "email"]
-)
-oidc_server.register_client(demo_client)
-
-client_id = demo_client.client_id
-client_secret = demo_client.client_secret
-
-# Note: In a real setup, client would use separate JWT handler for verification
-# For this demo UI, we'll skip full client initialization as we call server methods directly
-
-# Load benchmark results
-benchmark_data = None
-try:
-    with open('benchmark_results/benchmark_results.json', 'r') as f:
-        benchmark_data = json.load(f)
-except:
-    benchmark_data = []
+# Upper bound on /api/kemtls/handshake "iterations" per request
+MAX_HANDSHAKE_ITERATIONS = 1000
+
+# Message signed by /api/signatures/test when the request does not supply one
+_DEFAULT_MESSAGE = b'Hello, Post-Quantum World!'
+
+
+@dataclass(frozen=True)
+class _OIDCDemoState:
+    """OIDC objects shared by the demo views"""
+    jwt_handler: PQJWTHandler
+    oidc_server: PQOIDCServer
+    client_id: str
+    client_secret: str
+
+
+_oidc_state: Optional[_OIDCDemoState] = None
+_oidc_state_lock = threading.Lock()
+
+
+def _build_oidc_state() -> _OIDCDemoState:
+    """Create the IdP signing key, OIDC server, demo user and demo client"""
+    # Only needed here, on first use of an OIDC endpoint
+    import secrets
+    from src.oidc.server import User, Client
+    
+    # Initialize JWT handler with PQ signature algorithm
+    jwt_handler = PQJWTHandler(algorithm="ML-DSA-44", issuer="https://pq-oidc-demo.local")
+    jwt_handler.generate_keypair()
+    
+    # Initialize OIDC components
+    oidc_server = PQOIDCServer(
+        issuer="https://pq-oidc-demo.local",
+        jwt_handler=jwt_handler
+    )
+    
+    # Add demo user and client
+    demo_user = User(
+        user_id="demo_user_id",
+        username="demo_user",
+        password_hash="demo123",  # In production, use proper hashing
+        email="demo@example.com",
+        name="Demo User",
+        given_name="Demo",
+        family_name="User"
+    )
+    oidc_server.register_user(demo_user)
+    demo_user.userinfo  # Warm the cached UserInfo claims before the first flow
+    
+    # Register demo client
+    demo_client = Client(
+        client_id="demo_client_" + secrets.token_hex(8),
+        client_secret="demo_secret_" + secrets.token_hex(16),
+        redirect_uris=["http://localhost:5000/callback"],
+        grant_types=["authorization_code"],
+        response_types=["code"],
+        scope=["openid", "profile", "email"]
+    )
+    oidc_server.register_client(demo_client)
+    
+    # Note: In a real setup, client would use separate JWT handler for verification
+    # For this demo UI, we'll skip full client initialization as we call server methods directly
+    return _OIDCDemoState(
+        jwt_handler=jwt_handler,
+        oidc_server=oidc_server,
+        client_id=demo_client.client_id,
+        client_secret=demo_client.client_secret
+    )
+
+
+def _get_oidc_state() -> _OIDCDemoState:
+    """
+    Return the demo OIDC state, building it on first use
+    
+    The ML-DSA keygen and server setup are deferred until a view needs
+    them, so importing the app (worker start, flask CLI) stays cheap and
+    workers that only serve static pages never pay for it.
+    """
+    global _oidc_state
+    state = _oidc_state
+    if state is None:
+        with _oidc_state_lock:
+            state = _oidc_state
+            if state is None:
+                state = _oidc_state = _build_oidc_state()
+    return state
+
+
+# Per-thread KyberKEM/DilithiumSigner instances, keyed by (class, algorithm,
+# role). Every request regenerates the keypair it measures, so the wrappers
+# and their liboqs handles can be reused; thread-local storage keeps
+# concurrent requests on the threaded server apart without locking.
+_demo_primitives = threading.local()
+
+
+def _demo_primitive(cls, algorithm: str, role: str = ""):
+    """Return the calling thread's reusable ``cls(algorithm)`` for ``role``"""
+    instances = getattr(_demo_primitives, "instances", None)
+    if instances is None:
+        instances = _demo_primitives.instances = {}
+    key = (cls, algorithm, role)
+    instance = instances.get(key)
+    if instance is None:
+        instance = instances[key] = cls(algorithm)
+    return instance
+
+
+class _ClientKeypairPool:
+    """
+    Background-refilled queue of pre-generated client Kyber keypairs
+    
+    A daemon thread keeps up to ``size`` (KyberKEM, public_key, keygen_ns)
+    entries ready, so a handshake can skip the client keygen step. Each
+    entry is handed out once; its KEM holds the matching secret key.
+    """
+    
+    def __init__(self, algorithm: str, size: int = 16):
+        self.algorithm = algorithm
+        self._queue: "queue.Queue[Tuple[KyberKEM, bytes, int]]" = queue.Queue(maxsize=size)
+        threading.Thread(
+            target=self._fill, name=f"keypair-pool-{algorithm}", daemon=True
+        ).start()
+    
+    def _fill(self):
+        while True:
+            kem = KyberKEM(self.algorithm)
+            start = time.perf_counter_ns()
+            public_key = kem.generate_keypair()
+            self._queue.put((kem, public_key, time.perf_counter_ns() - start))
+    
+    def take(self) -> Optional[Tuple[KyberKEM, bytes, int]]:
+        """Return a pre-generated entry, or None if the pool is drained"""
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+
+_client_keypair_pools: Dict[str, _ClientKeypairPool] = {}
+_client_keypair_pools_lock = threading.Lock()
+
+
+def _client_keypair_pool(algorithm: str) -> _ClientKeypairPool:
+    """Return the keypair pool for ``algorithm``, starting it on first use"""
+    pool = _client_keypair_pools.get(algorithm)
+    if pool is None:
+        if algorithm not in KyberKEM.SUPPORTED_ALGORITHMS:
+            raise ValueError(f"Unsupported algorithm: {algorithm}")
+        with _client_keypair_pools_lock:
+            pool = _client_keypair_pools.get(algorithm)
+            if pool is None:
+                pool = _client_keypair_pools[algorithm] = _ClientKeypairPool(algorithm)
+    return pool
+
+
+@lru_cache(maxsize=1)
+def _get_benchmark_data() -> list:
+    """Load benchmark results on first use"""
+    try:
+        with open('benchmark_results/benchmark_results.json', 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+@lru_cache(maxsize=1)
+def _get_benchmark_payload() -> Tuple[bytes, str]:
+    """Encode the (static) benchmark results once, with a strong ETag"""
+    data = _get_benchmark_data()
+    if orjson is not None:
+        body = orjson.dumps(data)
+    else:
+        body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return body, hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+_static_pages: Dict[str, Tuple[bytes, str]] = {}
+
+
+def _static_page(template: str, **context: Any) -> Response:
+    """
+    Render a page whose content is fixed for the process lifetime
+    
+    The body is rendered once per template (``context`` must not change
+    between calls) and served with a strong ETag, so repeat visits get a
+    304. Caching is skipped while templates auto-reload (debug mode).
+    """
+    page = _static_pages.get(template)
+    if page is None:
+        body = render_template(template, **context).encode('utf-8')
+        page = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        if not app.jinja_env.auto_reload:
+            _static_pages[template] = page
+    response = Response(page[0], mimetype='text/html')
+    response.set_etag(page[1])
+    return response.make_conditional(request)
+
+
+def _add_timing(result: dict, name: str, samples_ns: Sequence[int]) -> float:
+    """
+    Report per-step timings in milliseconds under ``<name>_time_ms``
+    
+    A single sample is reported as is; repeated samples report the median,
+    plus ``_min`` and ``_stdev`` entries. Returns the reported value.
+    """
+    value = statistics.median(samples_ns) / 1e6
+    result[f'{name}_time_ms'] = round(value, 4)
+    if len(samples_ns) > 1:
+        result[f'{name}_time_ms_min'] = round(min(samples_ns) / 1e6, 4)
+        result[f'{name}_time_ms_stdev'] = round(statistics.stdev(samples_ns) / 1e6, 4)
+    return value
 
 
 @app.route('/')
 def index():
     """Main dashboard"""
-    return render_template('index.html')
+    return _static_page('index.html')
 
 
 @app.route('/demo/kemtls')
 def demo_kemtls():
     """KEMTLS handshake demonstration"""
-    return render_template('kemtls_demo.html')
+    return _static_page('kemtls_demo.html')
 
 
 @app.route('/api/kemtls/handshake', methods=['POST'])
 def api_kemtls_handshake():
-    """Perform KEMTLS handshake and return results"""
+    """
+    Perform KEMTLS handshake and return results
+    
+    An optional ``iterations`` (up to MAX_HANDSHAKE_ITERATIONS) repeats the
+    handshake; the reported step times are then medians, with min/stdev.
+    With ``pregenerated: true`` client keypairs come from a background pool
+    when one is ready, and keygen times are those recorded at pool-fill time.
+    ``sizes_only: true`` answers from the static parameter table without
+    running the handshake.
+    """
     try:
-        algorithm = request.json.get('algorithm', 'Kyber768')
+        data = request.get_json(silent=True) or {}
+        algorithm = data.get('algorithm', 'Kyber768')
+        if data.get('sizes_only'):
+            info = KyberKEM.get_algorithm_info(algorithm)
+            if info:
+                return jsonify({
+                    'success': True,
+                    'algorithm': algorithm,
+                    'sizes_only': True,
+                    'client_pk_size': info['public_key_size'],
+                    'ciphertext_size': info['ciphertext_size'],
+                    'shared_secret_size': info['shared_secret_size'],
+                })
+        iterations = min(max(int(data.get('iterations', 1)), 1), MAX_HANDSHAKE_ITERATIONS)
+        keypair_pool = _client_keypair_pool(algorithm) if data.get('pregenerated') else None
         
-        # Client side
-        client_kem = KyberKEM(algorithm)
-        start = time.perf_counter()
-        client_public_key = client_kem.generate_keypair()
-        keygen_time = (time.perf_counter() - start) * 1000
+        client_kem = _demo_primitive(KyberKEM, algorithm, "client")
+        server_kem = _demo_primitive(KyberKEM, algorithm, "server")
+        keygen_ns = array('q', [0]) * iterations
+        encap_ns = array('q', [0]) * iterations
+        decap_ns = array('q', [0]) * iterations
+        pregenerated = 0
+        secrets_match = True
         
-        # Server side
-        server_kem = KyberKEM(algorithm)
-        start = time.perf_counter()
-        ciphertext, server_shared_secret = server_kem.encapsulate(client_public_key)
-        encap_time = (time.perf_counter() - start) * 1000
+        for i in range(iterations):
+            pooled = keypair_pool.take() if keypair_pool is not None else None
+            if pooled is None:
+                # Client keygen
+                kem = client_kem
+                t0 = time.perf_counter_ns()
+                client_public_key = kem.generate_keypair()
+                t1 = time.perf_counter_ns()
+                keygen_ns[i] = t1 - t0
+            else:
+                kem, client_public_key, keygen_ns[i] = pooled
+                pregenerated += 1
+                t1 = time.perf_counter_ns()
+            
+            # Server encapsulation, client decapsulation
+            ciphertext, server_shared_secret = server_kem.encapsulate(client_public_key)
+            t2 = time.perf_counter_ns()
+            client_shared_secret = kem.decapsulate(ciphertext)
+            t3 = time.perf_counter_ns()
+            if pooled is not None:
+                kem.close()
+            
+            encap_ns[i] = t2 - t1
+            decap_ns[i] = t3 - t2
+            # Verify shared secrets match
+            secrets_match = secrets_match and client_shared_secret == server_shared_secret
         
-        # Client decapsulation
-        start = time.perf_counter()
-        client_shared_secret = client_kem.decapsulate(ciphertext)
-        decap_time = (time.perf_counter() - start) * 1000
-        
-        # Verify shared secrets match
-        secrets_match = client_shared_secret == server_shared_secret
-        
-        return jsonify({
+        result = {
             'success': True,
             'algorithm': algorithm,
-            'keygen_time_ms': round(keygen_time, 4),
-            'encap_time_ms': round(encap_time, 4),
-            'decap_time_ms': round(decap_time, 4),
-            'total_time_ms': round(keygen_time + encap_time + decap_time, 4),
             'client_pk_size': len(client_public_key),
             'ciphertext_size': len(ciphertext),
             'shared_secret_size': len(client_shared_secret),
             'secrets_match': secrets_match,
             'message': 'KEMTLS handshake completed successfully!' if secrets_match else 'Error: Shared secrets do not match'
-        })
+        }
+        total_ms = 0.0
+        for name, samples in (('keygen', keygen_ns), ('encap', encap_ns), ('decap', decap_ns)):
+            total_ms += _add_timing(result, name, samples)
+        result['total_time_ms'] = round(total_ms, 4)
+        if iterations > 1:
+            result['iterations'] = iterations
+        if keypair_pool is not None:
+            result['keygen_pregenerated'] = pregenerated
+        return jsonify(result)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -137,48 +420,63 @@ def api_kemtls_handshake():
 @app.route('/demo/signatures')
 def demo_signatures():
     """Digital signatures demonstration"""
-    return render_template('signatures_demo.html')
+    return _static_page('signatures_demo.html')
 
 
 @app.route('/api/signatures/test', methods=['POST'])
 def api_signatures_test():
-    """Test digital signature"""
+    """
+    Test digital signature
+    
+    Set ``test_invalid: true`` to also check that a tampered signature is
+    rejected (reported as ``invalid_rejected``; null when not requested).
+    ``sizes_only: true`` answers from the static parameter table without
+    generating a key or signature (Falcon's signature_size is then the
+    maximum, as its signatures are variable-length).
+    """
     try:
-        algorithm = request.json.get('algorithm', 'ML-DSA-44')
-        message = request.json.get('message', 'Hello, Post-Quantum World!').encode()
+        data = request.get_json(silent=True) or {}
+        algorithm = data.get('algorithm', 'ML-DSA-44')
+        if data.get('sizes_only'):
+            info = DilithiumSigner.get_algorithm_info(algorithm)
+            if info:
+                return jsonify({
+                    'success': True,
+                    'algorithm': algorithm,
+                    'sizes_only': True,
+                    'public_key_size': info['public_key_size'],
+                    'signature_size': info['signature_size'],
+                })
+        message = data['message'].encode() if 'message' in data else _DEFAULT_MESSAGE
         
-        # Generate keypair
-        signer = DilithiumSigner(algorithm)
-        start = time.perf_counter()
+        # Keygen, sign, verify, timed back to back
+        signer = _demo_primitive(DilithiumSigner, algorithm)
+        t0 = time.perf_counter_ns()
         public_key = signer.generate_keypair()
-        keygen_time = (time.perf_counter() - start) * 1000
-        
-        # Sign message
-        start = time.perf_counter()
+        t1 = time.perf_counter_ns()
         signature = signer.sign(message)
-        sign_time = (time.perf_counter() - start) * 1000
-        
-        # Verify signature
-        start = time.perf_counter()
+        t2 = time.perf_counter_ns()
         is_valid = signer.verify(message, signature, public_key)
-        verify_time = (time.perf_counter() - start) * 1000
+        t3 = time.perf_counter_ns()
         
-        # Test with invalid signature
-        invalid_signature = b'invalid' + signature[7:]
-        is_invalid = not signer.verify(message, invalid_signature, public_key)
+        # Test with invalid signature (a second full verify, so only on request)
+        is_invalid = None
+        if data.get('test_invalid', False):
+            invalid_signature = b'invalid' + signature[7:]
+            is_invalid = not signer.verify(message, invalid_signature, public_key)
         
         return jsonify({
             'success': True,
             'algorithm': algorithm,
-            'keygen_time_ms': round(keygen_time, 4),
-            'sign_time_ms': round(sign_time, 4),
-            'verify_time_ms': round(verify_time, 4),
-            'total_time_ms': round(keygen_time + sign_time + verify_time, 4),
+            'keygen_time_ms': round((t1 - t0) / 1e6, 4),
+            'sign_time_ms': round((t2 - t1) / 1e6, 4),
+            'verify_time_ms': round((t3 - t2) / 1e6, 4),
+            'total_time_ms': round((t3 - t0) / 1e6, 4),
             'public_key_size': len(public_key),
             'signature_size': len(signature),
             'is_valid': is_valid,
             'invalid_rejected': is_invalid,
-            'message': 'Signature verification successful!' if (is_valid and is_invalid) else 'Error in signature verification'
+            'message': 'Signature verification successful!' if (is_valid and is_invalid is not False) else 'Error in signature verification'
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -187,39 +485,37 @@ def api_signatures_test():
 @app.route('/demo/jwt')
 def demo_jwt():
     """JWT demonstration"""
-    return render_template('jwt_demo.html')
+    return _static_page('jwt_demo.html')
 
 
 @app.route('/api/jwt/create', methods=['POST'])
 def api_jwt_create():
     """Create and verify JWT"""
     try:
-        algorithm = request.json.get('algorithm', 'ML-DSA-44')
-        user_id = request.json.get('user_id', 'user_123')
+        data = request.get_json(silent=True) or {}
+        algorithm = data.get('algorithm', 'ML-DSA-44')
+        user_id = data.get('user_id', 'user_123')
         
         # Create JWT handler
         jwt_handler = PQJWTHandler(algorithm=algorithm)
         jwt_handler.generate_keypair()
         
-        # Create ID token
-        start = time.perf_counter()
+        # Create and verify an ID token
+        t0 = time.perf_counter_ns()
         id_token = jwt_handler.create_id_token(
             user_id=user_id,
             client_id="demo_client",
             nonce="abc123"
         )
-        create_time = (time.perf_counter() - start) * 1000
-        
-        # Verify token
-        start = time.perf_counter()
+        t1 = time.perf_counter_ns()
         claims = jwt_handler.verify_jwt(id_token)
-        verify_time = (time.perf_counter() - start) * 1000
+        t2 = time.perf_counter_ns()
         
         return jsonify({
             'success': True,
             'algorithm': algorithm,
-            'create_time_ms': round(create_time, 4),
-            'verify_time_ms': round(verify_time, 4),
+            'create_time_ms': round((t1 - t0) / 1e6, 4),
+            'verify_time_ms': round((t2 - t1) / 1e6, 4),
             'token_size': len(id_token),
             'token': id_token[:100] + '...' if len(id_token) > 100 else id_token,
             'claims': claims,
@@ -232,115 +528,147 @@ def api_jwt_create():
 @app.route('/demo/oidc')
 def demo_oidc():
     """OIDC flow demonstration"""
-    return render_template('oidc_demo.html', 
-                         client_id=client_id,
-                         client_secret=client_secret[:10] + '...')
+    state = _get_oidc_state()
+    return _static_page('oidc_demo.html', 
+                        client_id=state.client_id,
+                        client_secret=state.client_secret[:10] + '...')
+
+
+def _run_oidc_flow(state: _OIDCDemoState, username: str, password: str):
+    """
+    Run the demo OIDC flow, yielding each step's result as it completes
+    
+    The last item is either the flow summary or, if a step fails, an error
+    item with ``success: False``. total_time_ms covers only the time spent
+    running the flow, not time suspended while a consumer flushes a step.
+    """
+    oidc_server = state.oidc_server
+    elapsed = 0.0
+    
+    # Step 1: User authentication
+    resume = start = time.perf_counter()
+    user_id = oidc_server.authenticate_user(username, password)
+    if not user_id:
+        yield {'success': False, 'error': 'Invalid credentials'}
+        return
+    now = time.perf_counter()
+    elapsed += now - resume
+    yield {
+        'step': 1,
+        'name': 'User Authentication',
+        'time_ms': round((now - start) * 1000, 4),
+        'status': 'success'
+    }
+    
+    # Step 2: Authorization code generation (direct method)
+    resume = start = time.perf_counter()
+    code = oidc_server.generate_authorization_code(
+        client_id=state.client_id,
+        user_id=user_id,
+        redirect_uri="http://localhost:5000/callback",
+        scope=["openid", "profile", "email"],
+        nonce="nonce123"
+    )
+    now = time.perf_counter()
+    elapsed += now - resume
+    yield {
+        'step': 2,
+        'name': 'Authorization Code Generation',
+        'time_ms': round((now - start) * 1000, 4),
+        'status': 'success',
+        'code': code[:20] + '...'
+    }
+    
+    # Step 3: Token exchange
+    resume = start = time.perf_counter()
+    tokens, error = oidc_server.handle_token_request(
+        grant_type="authorization_code",
+        code=code,
+        redirect_uri="http://localhost:5000/callback",
+        client_id=state.client_id,
+        client_secret=state.client_secret
+    )
+    if error:
+        yield {'success': False, 'error': f'Token exchange failed: {error}'}
+        return
+    now = time.perf_counter()
+    elapsed += now - resume
+    yield {
+        'step': 3,
+        'name': 'Token Exchange',
+        'time_ms': round((now - start) * 1000, 4),
+        'status': 'success',
+        'id_token_size': len(tokens['id_token']),
+        'access_token_size': len(tokens['access_token'])
+    }
+    
+    # Step 4: Verify ID token
+    resume = start = time.perf_counter()
+    claims = oidc_server.jwt_handler.verify_jwt(tokens['id_token'])
+    now = time.perf_counter()
+    elapsed += now - resume
+    yield {
+        'step': 4,
+        'name': 'ID Token Verification',
+        'time_ms': round((now - start) * 1000, 4),
+        'status': 'success',
+        'claims': claims
+    }
+    
+    # Step 5: Get user info (simplified - fetch user directly)
+    resume = start = time.perf_counter()
+    # Since handle_userinfo_request isn't fully implemented, we'll get user info directly
+    user = oidc_server.users_by_id.get(user_id)
+    userinfo = user.userinfo if user else {}
+    now = time.perf_counter()
+    elapsed += now - resume
+    yield {
+        'step': 5,
+        'name': 'UserInfo Retrieval',
+        'time_ms': round((now - start) * 1000, 4),
+        'status': 'success',
+        'userinfo': userinfo
+    }
+    
+    yield {
+        'success': True,
+        'total_time_ms': round(elapsed * 1000, 4),
+        'message': 'Complete OIDC flow executed successfully!'
+    }
 
 
 @app.route('/api/oidc/flow', methods=['POST'])
 def api_oidc_flow():
-    """Simulate complete OIDC flow"""
+    """
+    Simulate complete OIDC flow
+    
+    With ``?stream=1`` the steps are sent as NDJSON, one line per step as
+    soon as it completes, followed by the summary (or error) line.
+    """
     try:
-        username = request.json.get('username', 'demo_user')
-        password = request.json.get('password', 'demo123')
-        
-        flow_steps = []
-        start_total = time.perf_counter()
+        state = _get_oidc_state()
+        data = request.get_json(silent=True) or {}
+        username = data.get('username', 'demo_user')
+        password = data.get('password', 'demo123')
+        flow = _run_oidc_flow(state, username, password)
         
-        # Step 1: User authentication
-        start = time.perf_counter()
-        user_id = oidc_server.authenticate_user(username, password)
-        if not user_id:
-            return jsonify({'success': False, 'error': 'Invalid credentials'})
-        flow_steps.append({
-            'step': 1,
-            'name': 'User Authentication',
-            'time_ms': round((time.perf_counter() - start) * 1000, 4),
-            'status': 'success'
-        })
-        
-        # Step 2: Authorization code generation (direct method)
-        start = time.perf_counter()
-        code = oidc_server.generate_authorization_code(
-            client_id=client_id,
-            user_id=user_id,
-            redirect_uri="http://localhost:5000/callback",
-            scope=["openid", "profile", "email"],
-            nonce="nonce123"
-        )
-        flow_steps.append({
-            'step': 2,
-            'name': 'Authorization Code Generation',
-            'time_ms': round((time.perf_counter() - start) * 1000, 4),
-            'status': 'success',
-            'code': code[:20] + '...'
-        })
-        
-        # Step 3: Token exchange
-        start = time.perf_counter()
-        tokens, error = oidc_server.handle_token_request(
-            grant_type="authorization_code",
-            code=code,
-            redirect_uri="http://localhost:5000/callback",
-            client_id=client_id,
-            client_secret=client_secret
-        )
-        if error:
-            return jsonify({'success': False, 'error': f'Token exchange failed: {error}'})
-        flow_steps.append({
-            'step': 3,
-            'name': 'Token Exchange',
-            'time_ms': round((time.perf_counter() - start) * 1000, 4),
-            'status': 'success',
-            'id_token_size': len(tokens['id_token']),
-            'access_token_size': len(tokens['access_token'])
-        })
-        
-        # Step 4: Verify ID token
-        start = time.perf_counter()
-        claims = oidc_server.jwt_handler.verify_jwt(tokens['id_token'])
-        flow_steps.append({
-            'step': 4,
-            'name': 'ID Token Verification',
-            'time_ms': round((time.perf_counter() - start) * 1000, 4),
-            'status': 'success',
-            'claims': claims
-        })
+        if request.args.get('stream') == '1':
+            def generate():
+                try:
+                    for item in flow:
+                        yield app.json.dumps(item) + '\n'
+                except Exception as e:
+                    yield app.json.dumps({'success': False, 'error': str(e)}) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
         
-        # Step 5: Get user info (simplified - fetch user directly)
-        start = time.perf_counter()
-        # Since handle_userinfo_request isn't fully implemented, we'll get user info directly
-        user = None
-        for u in oidc_server.users.values():
-            if u.user_id == user_id:
-                user = u
-                break
-        
-        userinfo = {
-            'sub': user.user_id,
-            'name': user.name,
-            'given_name': user.given_name,
-            'family_name': user.family_name,
-            'email': user.email,
-            'email_verified': True
-        } if user else {}
-        
-        flow_steps.append({
-            'step': 5,
-            'name': 'UserInfo Retrieval',
-            'time_ms': round((time.perf_counter() - start) * 1000, 4),
-            'status': 'success',
-            'userinfo': userinfo
-        })
-        
-        total_time = (time.perf_counter() - start_total) * 1000
-        
-        return jsonify({
-            'success': True,
-            'total_time_ms': round(total_time, 4),
-            'steps': flow_steps,
-            'message': 'Complete OIDC flow executed successfully!'
-        })
+        flow_steps = []
+        for item in flow:
+            if 'step' not in item:
+                if not item['success']:
+                    return jsonify(item)
+                return jsonify({**item, 'steps': flow_steps})
+            flow_steps.append(item)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -348,28 +676,36 @@ def api_oidc_flow():
 @app.route('/benchmarks')
 def benchmarks():
     """Display benchmark results"""
-    return render_template('benchmarks.html', benchmarks=benchmark_data)
+    return _static_page('benchmarks.html', benchmarks=_get_benchmark_data())
 
 
 @app.route('/api/benchmarks')
 def api_benchmarks():
     """Get benchmark data as JSON"""
-    return jsonify(benchmark_data)
+    body, etag = _get_benchmark_payload()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    # Answers If-None-Match with 304 Not Modified
+    return response.make_conditional(request)
 
 
 @app.route('/architecture')
 def architecture():
     """System architecture visualization"""
-    return render_template('architecture.html')
+    return _static_page('architecture.html')
 
 
 if __name__ == '__main__':
+    port = int(os.environ.get('PQC_PORT', '5000'))
+    
     print("\n" + "="*60)
     print("Post-Quantum OIDC Demo UI")
     print("="*60)
-    print(f"\n✓ Server starting at http://localhost:5000")
+    print(f"\n✓ Server starting at http://localhost:{port}")
     print(f"✓ Demo credentials: demo_user / demo123")
-    print(f"✓ Client ID: {client_id}")
+    print(f"✓ Client ID: {_get_oidc_state().client_id}")
+    print(f"✓ liboqs backend: {liboqs_backend_summary()}")
     print("\nAvailable demos:")
     print("  • KEMTLS Handshake")
     print("  • Digital Signatures")
@@ -379,4 +715,9 @@ if __name__ == '__main__':
     print("  • Architecture Overview")
     print("\n" + "="*60 + "\n")
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    if os.environ.get('PQC_DEBUG') == '1' or serve is None:
+        # Flask development server; PQC_DEBUG=1 enables the debugger and reloader
+        app.run(debug=os.environ.get('PQC_DEBUG') == '1', host='0.0.0.0', port=port, threaded=True)
+    else:
+        # liboqs releases the GIL, so worker threads overlap the PQ crypto calls
+        serve(app, host='0.0.0.0', port=port, threads=max(4, (os.cpu_count() or 1) * 2))
@@ -0,0 +1,26 @@
+"""
+Gunicorn settings for serving the demo UI with several workers
+
+Usage (from the project root):
+    gunicorn -c ui/gunicorn.conf.py ui.app:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PQC_PORT', '5000')}"
+reuse_port = True
+
+# Threads overlap the PQ crypto calls (liboqs releases the GIL); workers add cores
+workers = int(os.environ.get("PQC_WORKERS", os.cpu_count() or 1))
+worker_class = "gthread"
+threads = 8
+
+# Import the app once in the master so workers share it copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    """Build the IdP key and demo client before forking, so all workers share them"""
+    from ui.app import _get_oidc_state, liboqs_backend_summary
+    server.log.info("liboqs backend: %s", liboqs_backend_summary())
+    _get_oidc_state()